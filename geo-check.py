@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Behaviour check for the geohash position queries in geo.py.
+
+Fills an in-memory positions table with random nodes, then compares
+query_bbox and query_nearest against a brute-force scan of the same rows.
+Fails on the first query whose result differs.
+
+Usage: python geo-check.py [nodes] [queries]
+"""
+
+import random
+import sqlite3
+import sys
+
+from geo import geohash_encode, haversine_km, query_bbox, query_nearest
+
+default_nodes = 20000
+default_queries = 100
+
+def build_table(nodes):
+    """Return a cursor over an in-memory positions table with the bot's geohash index."""
+    conn = sqlite3.connect(':memory:')
+    cursor = conn.cursor()
+    cursor.execute('''CREATE TABLE positions
+                      (node_num INTEGER PRIMARY KEY, short_name TEXT, latitude REAL, longitude REAL, geohash TEXT)''')
+    cursor.execute('CREATE INDEX positions_geohash ON positions (geohash)')
+    rows = []
+    for node_num in range(nodes):
+        # Cluster half the nodes so the queries see both dense and sparse areas
+        if node_num % 2:
+            latitude, longitude = random.gauss(38.9, 0.5), random.gauss(-77.0, 0.5)
+        else:
+            latitude, longitude = random.uniform(-85.0, 85.0), random.uniform(-180.0, 180.0)
+        rows.append((node_num, f"n{node_num}", latitude, longitude, geohash_encode(latitude, longitude)))
+    cursor.executemany('INSERT INTO positions VALUES (?,?,?,?,?)', rows)
+    return cursor, rows
+
+def random_point():
+    if random.random() < 0.5:
+        return random.gauss(38.9, 0.5), random.gauss(-77.0, 0.5)
+    return random.uniform(-80.0, 80.0), random.uniform(-175.0, 175.0)
+
+def check_bbox(cursor, rows):
+    latitude, longitude = random_point()
+    half_height, half_width = random.choice((0.01, 0.1, 1.0, 5.0)), random.choice((0.01, 0.1, 1.0, 5.0))
+    box = (max(-90.0, latitude - half_height), max(-180.0, longitude - half_width),
+           min(90.0, latitude + half_height), min(180.0, longitude + half_width))
+    expected = sorted(row[:4] for row in rows if box[0] <= row[2] <= box[2] and box[1] <= row[3] <= box[3])
+    found = sorted(query_bbox(cursor, "positions", *box))
+    if found != expected:
+        return f"query_bbox{box}: {len(found)} row(s), brute force found {len(expected)}"
+    return None
+
+def check_nearest(cursor, rows):
+    latitude, longitude = random_point()
+    count = random.choice((1, 5, 20))
+    expected = sorted(haversine_km(latitude, longitude, row[2], row[3]) for row in rows)[:count]
+    found = [row[0] for row in query_nearest(cursor, "positions", latitude, longitude, count)]
+    # Compare distances so ties between equally distant nodes do not count as a failure
+    if len(found) != len(expected) or any(abs(a - b) > 1e-9 for a, b in zip(found, expected)):
+        return f"query_nearest({latitude:.4f}, {longitude:.4f}, {count}): distances {found} instead of {expected}"
+    return None
+
+if __name__ == "__main__":
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else default_nodes
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else default_queries
+    random.seed(1)
+
+    cursor, rows = build_table(nodes)
+    failures = []
+    for _ in range(queries):
+        for check in (check_bbox, check_nearest):
+            failure = check(cursor, rows)
+            if failure:
+                failures.append(failure)
+
+    print(f"Checked {queries} bounding-box and {queries} nearest-node queries over {nodes} nodes")
+    for failure in failures[:10]:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
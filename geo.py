@@ -0,0 +1,128 @@
+import math
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash_encode(latitude: float, longitude: float, precision: int = 9) -> str:
+    """Encode a coordinate as a geohash string."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(geohash) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits = bits << 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(geohash)
+
+def geohash_decode(geohash: str) -> tuple:
+    """Return the (latitude, longitude) centre of a geohash cell."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            target = lon_range if even else lat_range
+            mid = (target[0] + target[1]) / 2
+            if bit:
+                target[0] = mid
+            else:
+                target[1] = mid
+            even = not even
+
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+def geohash_cell_size(precision: int) -> tuple:
+    """Return the (height, width) in degrees of a geohash cell at the given precision."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = (5 * precision) // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+def geohash_prefix_range(prefix: str) -> tuple:
+    """Return (low, high) bounds so that low <= geohash < high matches every hash starting with prefix."""
+    # '{' sorts directly after 'z', the last geohash character
+    return prefix, prefix + "{"
+
+def geohash_cover(min_lat: float, min_lon: float, max_lat: float, max_lon: float, max_cells: int = 32) -> set:
+    """Return geohash prefixes that together cover a bounding box."""
+    for precision in range(9, 0, -1):
+        height, width = geohash_cell_size(precision)
+        rows = math.ceil((max_lat - min_lat) / height) + 1
+        cols = math.ceil((max_lon - min_lon) / width) + 1
+        if rows * cols <= max_cells:
+            break
+
+    cells = set()
+    for row in range(rows + 1):
+        lat = min(max_lat, min_lat + row * height)
+        for col in range(cols + 1):
+            lon = min(max_lon, min_lon + col * width)
+            cells.add(geohash_encode(lat, lon, precision))
+    return cells
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two coordinates in kilometres."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+def query_bbox(db_cursor, table_name: str, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> list:
+    """Return (node_num, short_name, latitude, longitude) rows inside a bounding box using the geohash index."""
+    rows = []
+    for prefix in geohash_cover(min_lat, min_lon, max_lat, max_lon):
+        low, high = geohash_prefix_range(prefix)
+        rows.extend(db_cursor.execute(f'''
+            SELECT node_num, short_name, latitude, longitude FROM {table_name}
+            WHERE geohash >= ? AND geohash < ? AND latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?
+        ''', (low, high, min_lat, max_lat, min_lon, max_lon)).fetchall())
+    return rows
+
+def query_nearest(db_cursor, table_name: str, latitude: float, longitude: float, count: int = 5) -> list:
+    """Return up to count (distance_km, node_num, short_name, latitude, longitude) rows nearest a point."""
+    candidates = []
+    for precision in range(7, 0, -1):
+        height, width = geohash_cell_size(precision)
+        # Search the cell around the point plus its eight neighbours
+        candidates = query_bbox(db_cursor, table_name,
+                                max(-90.0, latitude - height), max(-180.0, longitude - width),
+                                min(90.0, latitude + height), min(180.0, longitude + width))
+        if len(candidates) < count:
+            continue
+
+        ranked = sorted((haversine_km(latitude, longitude, row[2], row[3]),) + tuple(row) for row in candidates)
+        # Only trust the result if nothing outside the searched box could be closer
+        radius_km = min(haversine_km(latitude, longitude, latitude + height, longitude),
+                        haversine_km(latitude, longitude, latitude, longitude + width))
+        if ranked[count - 1][0] <= radius_km:
+            return ranked[:count]
+
+    # Too few nodes anywhere near the point for the geohash search to prove an answer, so rank them all
+    candidates = db_cursor.execute(f'SELECT node_num, short_name, latitude, longitude FROM {table_name}').fetchall()
+    ranked = sorted((haversine_km(latitude, longitude, row[2], row[3]),) + tuple(row) for row in candidates)
+    return ranked[:count]
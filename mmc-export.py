@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Streaming export of the fortune bot's messages, nodeinfo and routing tables.
+
+Reads fortune.db read-only inside a single read transaction. In WAL mode this is a
+consistent snapshot that never blocks the bot's writers. Rows are fetched in
+keyset-paginated pages, so memory stays bounded however large the tables are.
+
+Usage:
+    python mmc-export.py messages --format ndjson --output messages.ndjson
+    python mmc-export.py all --format csv --output-dir export/ --incremental
+    python mmc-export.py routing --format parquet --output routing.parquet   (needs pyarrow)
+    python mmc-export.py all --format parquet --output-dir export/ --incremental   (one part file per run)
+    python mmc-export.py messages --region msh/US/DMV/2/e/ --output dmv.ndjson
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+
+from tables import read_table_prefix
+
+db_file_path = 'fortune.db'
+state_file = 'export-state.json'
+page_size = 1000
+
+# table suffix -> keyset columns; pages continue from the last key written
+export_tables = {
+    "messages": ("_messages", ("rowid",)),
+    "nodeinfo": ("_nodeinfo", ("rowid",)),
+    "routing": ("_routing", ("last_seen", "node_num")),
+}
+# tables that can be limited to one region with --region
+region_tables = {"messages", "routing"}
+
+def load_state():
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_state(state):
+    temp_file = state_file + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(temp_file, state_file)
+
+def stream_rows(cursor, table, key_columns, start_key=None, region=None):
+    """Yield (column names, page of rows, last key) using keyset pagination."""
+    key_list = ", ".join(key_columns)
+    placeholders = ", ".join("?" for _ in key_columns)
+    last_key = list(start_key) if start_key else None
+    region_filter, region_params = ("region = ? AND ", (region,)) if region is not None else ("", ())
+
+    while True:
+        if last_key is None:
+            cursor.execute(f'SELECT {key_list}, * FROM {table} WHERE {region_filter}1 ORDER BY {key_list} LIMIT ?', (*region_params, page_size))
+        else:
+            # Row-value comparison walks the index from the last key instead of using OFFSET
+            cursor.execute(f'SELECT {key_list}, * FROM {table} WHERE {region_filter}({key_list}) > ({placeholders}) ORDER BY {key_list} LIMIT ?',
+                           (*region_params, *last_key, page_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+
+        columns = [description[0] for description in cursor.description][len(key_columns):]
+        last_key = list(rows[-1][:len(key_columns)])
+        yield columns, [row[len(key_columns):] for row in rows], last_key
+
+class NdjsonWriter:
+    def __init__(self, output):
+        self.output = output
+
+    def write(self, columns, rows):
+        for row in rows:
+            self.output.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+
+    def close(self, completed=True):
+        self.output.flush()
+
+class CsvWriter:
+    def __init__(self, output):
+        self.writer = csv.writer(output)
+        self.output = output
+        self.header_written = False
+
+    def write(self, columns, rows):
+        if not self.header_written:
+            self.writer.writerow(columns)
+            self.header_written = True
+        self.writer.writerows(rows)
+
+    def close(self, completed=True):
+        self.output.flush()
+
+class ParquetWriter:
+    def __init__(self, path, column_types):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.parquet = pyarrow.parquet
+        self.path = path
+        # Written under a temporary name and renamed only once the export completes
+        self.temp_path = path + '.tmp'
+        # The schema comes from the declared column types, not from whatever the first page happens to hold
+        arrow_types = {"INTEGER": pyarrow.int64(), "REAL": pyarrow.float64(), "BLOB": pyarrow.binary()}
+        self.schema = pyarrow.schema([(name, arrow_types.get(declared.upper(), pyarrow.string())) for name, declared in column_types])
+        self.writer = self.parquet.ParquetWriter(self.temp_path, self.schema)
+        self.row_count = 0
+
+    def write(self, columns, rows):
+        self.writer.write_table(self.pyarrow.Table.from_pylist([dict(zip(columns, row)) for row in rows], schema=self.schema))
+        self.row_count += len(rows)
+
+    def close(self, completed=True):
+        self.writer.close()
+        # An export with no rows leaves any existing file in place
+        if completed and self.row_count:
+            os.replace(self.temp_path, self.path)
+        else:
+            os.remove(self.temp_path)
+
+def open_writer(export_format, path, append, column_types):
+    """Return (writer, file handle or None) for the chosen format; '-' means stdout."""
+    if export_format == "parquet":
+        if path == "-":
+            sys.exit("Parquet output needs --output or --output-dir")
+        try:
+            return ParquetWriter(path, column_types), None
+        except ImportError:
+            sys.exit("Parquet export needs pyarrow: pip3 install pyarrow")
+
+    if path == "-":
+        handle = sys.stdout
+    else:
+        # Incremental exports append to the previous file
+        handle = open(path, 'a' if append else 'w', encoding='utf-8', newline='')
+    if export_format == "csv":
+        writer = CsvWriter(handle)
+        # Do not repeat the header when appending to an existing csv
+        writer.header_written = path != "-" and handle.tell() > 0
+        return writer, handle
+    return NdjsonWriter(handle), handle
+
+def part_path(path, start_key):
+    """Name the Parquet file for one incremental run after the watermark it starts from."""
+    base, extension = os.path.splitext(path)
+    watermark = "-".join(str(key) for key in start_key) if start_key else "0"
+    return f"{base}-{watermark}{extension}"
+
+def export_table(cursor, name, prefix, export_format, path, state, incremental, region=None):
+    suffix, key_columns = export_tables[name]
+    table = prefix + suffix
+    if region is not None and name not in region_tables:
+        region = None
+    # Watermarks are per table (and region), so a new table layout starts a fresh export
+    state_key = table if region is None else f"{table}:{region}"
+    start_key = state.get(state_key) if incremental else None
+    # Parquet files cannot be appended to, so each incremental run writes its own part file
+    if incremental and export_format == "parquet" and path != "-":
+        path = part_path(path, start_key)
+
+    column_types = [(row[1], row[2]) for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()]
+    if not column_types:
+        raise sqlite3.OperationalError(f"no such table: {table}")
+
+    writer, handle = open_writer(export_format, path, incremental, column_types)
+    count = 0
+    completed = False
+    new_state = {}
+    try:
+        for columns, rows, last_key in stream_rows(cursor, table, key_columns, start_key, region):
+            writer.write(columns, rows)
+            count += len(rows)
+            new_state[state_key] = last_key
+        completed = True
+    finally:
+        writer.close(completed)
+        if handle is not None and handle is not sys.stdout:
+            handle.close()
+
+    # Only advance the watermark once the rows are safely in the output
+    state.update(new_state)
+    print(f"Exported {count} {name} row(s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export fortune bot tables without blocking the bot.")
+    parser.add_argument("table", choices=list(export_tables) + ["all"])
+    parser.add_argument("--format", choices=["ndjson", "csv", "parquet"], default="ndjson")
+    parser.add_argument("--output", default="-", help="output file, '-' for stdout (single table only)")
+    parser.add_argument("--output-dir", help="write one file per table into this directory")
+    parser.add_argument("--incremental", action="store_true", help="only rows after the watermark saved by the last incremental export")
+    parser.add_argument("--region", help="only rows heard on this root topic (messages and routing)")
+    parser.add_argument("--db", default=db_file_path)
+    args = parser.parse_args()
+
+    names = list(export_tables) if args.table == "all" else [args.table]
+    if len(names) > 1 and not args.output_dir:
+        sys.exit("Exporting all tables needs --output-dir")
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    prefix = read_table_prefix()
+    state = load_state()
+
+    conn = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True, isolation_level=None)
+    cursor = conn.cursor()
+    # One read transaction for every table gives a single consistent snapshot
+    cursor.execute('BEGIN')
+    try:
+        for name in names:
+            path = os.path.join(args.output_dir, f"{name}.{args.format}") if args.output_dir else args.output
+            try:
+                export_table(cursor, name, prefix, args.format, path, state, args.incremental, args.region)
+            except sqlite3.OperationalError as e:
+                print(f"Skipping {name}: {e}", file=sys.stderr)
+    finally:
+        cursor.execute('COMMIT')
+        conn.close()
+
+    if args.incremental:
+        save_state(state)
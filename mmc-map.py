@@ -1,45 +1,186 @@
+import argparse
 import sqlite3
-import folium
-import re
-from statistics import mean
-
-mqtt_broker = 'mqtt.meshtastic.org'
-topic = 'msh/US/2/e'
-channel = 'LongFast'
-
-def sanitize_string(input_str):
-    # Check if the string starts with a letter (a-z, A-Z) or an underscore (_)
-    if not re.match(r'^[a-zA-Z_]', input_str):
-        # If not, add "_"
-        input_str = '_' + input_str
-
-    # Replace special characters with underscores (for database tables)
-    sanitized_str = re.sub(r'[^a-zA-Z0-9_]', '_', input_str)
-    return sanitized_str
-
-table = sanitize_string(mqtt_broker) + "_" + sanitize_string(topic) + "_" + sanitize_string(channel) + "_positions"
-
-# Connect to SQLite database
-conn = sqlite3.connect('mmc.db')
-cursor = conn.cursor()
-
-# Fetch latitude, longitude, and short_name data from the database
-cursor.execute(f'SELECT latitude, longitude, short_name FROM {table};')
-data = cursor.fetchall()
-
-# Calculate the mean of latitude and longitude
-mean_lat = mean(row[0] for row in data)
-mean_lon = mean(row[1] for row in data)
-
-# Create a Folium map centered at the mean location
-my_map = folium.Map(location=[mean_lat, mean_lon], zoom_start=3)
-
-# Add markers to the map based on the database data
-for lat, lon, short_name in data:
-    # Add labels using the short_name column
-    label = short_name
-    icon = folium.Icon(color='blue', icon='tower-broadcast', prefix='fa')
-    folium.Marker([lat, lon], popup=label, icon=icon).add_to(my_map)
-
-# Save the map as an HTML file
-my_map.save('mmc-map.html')
\ No newline at end of file
+import json
+import os
+import sys
+
+from geo import geohash_prefix_range, query_bbox, query_nearest
+from tables import read_table_prefix
+
+# Geohash precision of one output tile and of one marker bin inside a tile
+tile_precision = 3
+bin_precision = 6
+
+db_file_path = 'fortune.db'
+output_dir = 'mmc-map'
+tiles_dir = os.path.join(output_dir, 'tiles')
+state_file = os.path.join(output_dir, 'state.json')
+
+def load_config():
+    """Return the bot's positions table for the broker and channel in config.ini."""
+    return read_table_prefix() + "_positions"
+
+def load_state():
+    """Load the render watermark and the tile each node was last drawn in."""
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"watermark": None, "node_tiles": {}}
+
+def save_state(state):
+    """Write the state file atomically so an interrupted run re-renders instead of losing changes."""
+    temp_file = state_file + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(temp_file, state_file)
+
+def find_changed_tiles(cursor, table, state):
+    """Return tiles touched since the watermark, including tiles that nodes moved out of."""
+    node_tiles = state["node_tiles"]
+    watermark = state["watermark"]
+    changed = set()
+
+    if watermark is None:
+        rows = cursor.execute(f'SELECT node_num, substr(geohash, 1, ?), time FROM {table}', (tile_precision,))
+    else:
+        # Re-read the watermark second itself in case rows landed after the last run
+        rows = cursor.execute(f'SELECT node_num, substr(geohash, 1, ?), time FROM {table} WHERE time >= ?', (tile_precision, watermark))
+
+    for node_num, tile, row_time in rows:
+        previous_tile = node_tiles.get(str(node_num))
+        if previous_tile is not None and previous_tile != tile:
+            changed.add(previous_tile)
+        node_tiles[str(node_num)] = tile
+        changed.add(tile)
+        if watermark is None or row_time > watermark:
+            watermark = row_time
+
+    state["watermark"] = watermark
+    return changed
+
+def render_tile(cursor, table, tile):
+    """Write one GeoJSON tile with markers binned by geohash, aggregated in sqlite."""
+    low, high = geohash_prefix_range(tile)
+    features = []
+    for bin_hash, count, latitude, longitude, short_name in cursor.execute(f'''
+        SELECT substr(geohash, 1, ?) AS bin, COUNT(*), AVG(latitude), AVG(longitude), MIN(short_name)
+        FROM {table} WHERE geohash >= ? AND geohash < ? GROUP BY bin
+    ''', (bin_precision, low, high)):
+        label = (short_name or "?") if count == 1 else f"{count} nodes"
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [round(longitude, 5), round(latitude, 5)]},
+            "properties": {"bin": bin_hash, "count": count, "label": label},
+        })
+
+    tile_path = os.path.join(tiles_dir, tile + '.geojson')
+    if not features:
+        if os.path.exists(tile_path):
+            os.remove(tile_path)
+        return
+
+    with open(tile_path, 'w', encoding='utf-8') as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f, separators=(',', ':'))
+
+def render_index(cursor, table):
+    """Write the tile list and the Leaflet page that loads it."""
+    tiles = sorted(name[:-len('.geojson')] for name in os.listdir(tiles_dir) if name.endswith('.geojson'))
+    center = cursor.execute(f'SELECT AVG(latitude), AVG(longitude) FROM {table}').fetchone()
+    with open(os.path.join(output_dir, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump({"center": [center[0] or 0, center[1] or 0], "tiles": tiles}, f)
+
+    with open(os.path.join(output_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(MAP_HTML)
+
+MAP_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Mesh Fortune Map</title>
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css">
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<style>html, body, #map { height: 100%; margin: 0; }</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+fetch('index.json').then(r => r.json()).then(index => {
+  const map = L.map('map').setView(index.center, 3);
+  L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {attribution: '&copy; OpenStreetMap'}).addTo(map);
+  index.tiles.forEach(tile => fetch('tiles/' + tile + '.geojson').then(r => r.json()).then(data => {
+    L.geoJSON(data, {
+      pointToLayer: (feature, latlng) => L.circleMarker(latlng, {radius: 4 + Math.min(12, Math.log2(feature.properties.count) * 2)}),
+      onEachFeature: (feature, layer) => layer.bindPopup(feature.properties.label)
+    }).addTo(map);
+  }));
+});
+</script>
+</body>
+</html>
+"""
+
+def parse_coordinates(text, count):
+    """Parse a comma-separated list of count coordinates for argparse."""
+    try:
+        values = [float(value) for value in text.split(",")]
+    except ValueError:
+        values = []
+    if len(values) != count:
+        raise argparse.ArgumentTypeError(f"expected {count} comma-separated numbers, got {text!r}")
+    return values
+
+def run_query(table, args):
+    """Print the nodes inside --bbox or nearest --near instead of rendering tiles."""
+    conn = sqlite3.connect(f'file:{db_file_path}?mode=ro', uri=True)
+    try:
+        if args.bbox:
+            columns = ["node", "short_name", "latitude", "longitude"]
+            rows = sorted(query_bbox(conn.cursor(), table, *args.bbox))
+        else:
+            columns = ["distance_km", "node", "short_name", "latitude", "longitude"]
+            rows = [(round(row[0], 3),) + tuple(row[1:]) for row in query_nearest(conn.cursor(), table, *args.near, args.count)]
+    except sqlite3.OperationalError as e:
+        sys.exit(f"No positions recorded yet: {e}")
+    finally:
+        conn.close()
+
+    for row in rows:
+        record = dict(zip(columns, row))
+        record["node"] = f"!{record['node']:08x}"
+        print(json.dumps(record, ensure_ascii=False))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render recorded positions to GeoJSON tiles, or query them.")
+    parser.add_argument("--full", action="store_true", help="ignore the watermark and redraw every tile")
+    query = parser.add_mutually_exclusive_group()
+    query.add_argument("--bbox", type=lambda text: parse_coordinates(text, 4), metavar="MIN_LAT,MIN_LON,MAX_LAT,MAX_LON",
+                       help="print the nodes inside a bounding box instead of rendering")
+    query.add_argument("--near", type=lambda text: parse_coordinates(text, 2), metavar="LAT,LON",
+                       help="print the nodes nearest a point instead of rendering")
+    parser.add_argument("--count", type=int, default=5, help="how many nodes --near returns")
+    args = parser.parse_args()
+
+    table = load_config()
+    if args.bbox or args.near:
+        run_query(table, args)
+        sys.exit(0)
+
+    if args.full and os.path.exists(state_file):
+        os.remove(state_file)
+
+    os.makedirs(tiles_dir, exist_ok=True)
+
+    conn = sqlite3.connect(f'file:{db_file_path}?mode=ro', uri=True)
+    cursor = conn.cursor()
+
+    state = load_state()
+    changed_tiles = find_changed_tiles(cursor, table, state)
+    for tile in sorted(changed_tiles):
+        render_tile(cursor, table, tile)
+
+    render_index(cursor, table)
+    save_state(state)
+    conn.close()
+
+    print(f"Rendered {len(changed_tiles)} changed tile(s) to {output_dir}/")
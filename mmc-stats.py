@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Usage and telemetry reports for the fortune bot from its rollup tables.
+
+The bot counts DMs received and fortunes sent per hour, region and sender node
+and adds them to the _usage_1h table in batches. With record_telemetry on it
+also keeps 1-minute, 1-hour and 1-day device metric rollups. Reports read only
+those small tables, never the raw message or telemetry history.
+
+Usage:
+    python mmc-stats.py senders --days 7 --limit 10
+    python mmc-stats.py regions --days 7
+    python mmc-stats.py hourly --days 1 --region msh/US/DMV/2/e/
+    python mmc-stats.py telemetry --days 7
+    python mmc-stats.py telemetry --node !a1b2c3d4 --resolution 1m --days 1
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+from tables import read_table_prefix
+
+db_file_path = 'fortune.db'
+
+def region_filter(region):
+    return (" AND region = ?", (region,)) if region is not None else ("", ())
+
+def top_senders(cursor, prefix, since, args):
+    where, params = region_filter(args.region)
+    # Aggregate first so the name lookup only runs for the rows returned
+    rows = cursor.execute(f'''
+        SELECT '!' || printf('%08x', totals.node_num), nodeinfo.short_name, totals.dms, totals.fortunes
+        FROM (SELECT node_num, SUM(dms) AS dms, SUM(fortunes) AS fortunes FROM {prefix}_usage_1h
+              WHERE hour >= ?{where} GROUP BY node_num ORDER BY dms DESC LIMIT ?) AS totals
+        LEFT JOIN {prefix}_nodeinfo AS nodeinfo ON nodeinfo.user_id = '!' || printf('%08x', totals.node_num)
+        ORDER BY totals.dms DESC
+    ''', (since, *params, args.limit)).fetchall()
+    return ["node", "short_name", "dms", "fortunes"], rows
+
+def per_region(cursor, prefix, since, args):
+    where, params = region_filter(args.region)
+    rows = cursor.execute(f'''
+        SELECT region, SUM(fortunes), SUM(dms), COUNT(DISTINCT node_num) FROM {prefix}_usage_1h
+        WHERE hour >= ?{where} GROUP BY region ORDER BY SUM(fortunes) DESC LIMIT ?
+    ''', (since, *params, args.limit)).fetchall()
+    return ["region", "fortunes", "dms", "senders"], rows
+
+def per_hour(cursor, prefix, since, args):
+    where, params = region_filter(args.region)
+    rows = cursor.execute(f'''
+        SELECT hour, SUM(dms), SUM(fortunes) FROM {prefix}_usage_1h
+        WHERE hour >= ?{where} GROUP BY hour ORDER BY hour DESC LIMIT ?
+    ''', (since, *params, args.limit)).fetchall()
+    rows.reverse()
+    return ["hour", "dms", "fortunes"], [(datetime.fromtimestamp(hour).strftime('%Y-%m-%d %H:00'),) + tuple(row) for hour, *row in rows]
+
+def parse_node(text):
+    """Accept a node as !hex (as the bot prints it) or as a number."""
+    try:
+        return int(text[1:], 16) if text.startswith("!") else int(text, 0)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a node number: {text!r}")
+
+def round_metric(value):
+    return round(value, 2) if isinstance(value, float) else value
+
+def telemetry(cursor, prefix, since, args):
+    # Averages divide by each metric's own sample count; metrics a node never sent stay empty
+    averages = '''SUM(battery_sum) * 1.0 / NULLIF(SUM(battery_samples), 0), MIN(battery_min),
+                  SUM(voltage_sum) / NULLIF(SUM(voltage_samples), 0),
+                  SUM(channel_utilization_sum) / NULLIF(SUM(channel_utilization_samples), 0), MAX(channel_utilization_max),
+                  SUM(air_util_tx_sum) / NULLIF(SUM(air_util_tx_samples), 0), MAX(air_util_tx_max)'''
+    metrics = ["samples", "battery_avg", "battery_min", "voltage_avg", "channel_util_avg", "channel_util_max", "air_util_tx_avg", "air_util_tx_max"]
+    table = f"{prefix}_telemetry_{args.resolution}"
+
+    if args.node is None:
+        rows = cursor.execute(f'''
+            SELECT '!' || printf('%08x', node_num), SUM(samples), {averages} FROM {table}
+            WHERE bucket >= ? GROUP BY node_num ORDER BY SUM(samples) DESC LIMIT ?
+        ''', (since, args.limit)).fetchall()
+        return ["node"] + metrics, [tuple(round_metric(value) for value in row) for row in rows]
+
+    # The newest buckets for one node, printed oldest first
+    rows = cursor.execute(f'''
+        SELECT bucket, SUM(samples), {averages} FROM {table}
+        WHERE node_num = ? AND bucket >= ? GROUP BY bucket ORDER BY bucket DESC LIMIT ?
+    ''', (args.node, since, args.limit)).fetchall()
+    rows.reverse()
+    return ["bucket"] + metrics, [(datetime.fromtimestamp(bucket).strftime('%Y-%m-%d %H:%M'),) + tuple(round_metric(value) for value in row)
+                                  for bucket, *row in rows]
+
+reports = {
+    "senders": top_senders,
+    "regions": per_region,
+    "hourly": per_hour,
+    "telemetry": telemetry,
+}
+
+def print_table(columns, rows):
+    widths = [max([len(str(column))] + [len(str(row[i])) for row in rows]) for i, column in enumerate(columns)]
+    print("  ".join(str(column).ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(value if value is not None else "").ljust(width) for value, width in zip(row, widths)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report fortune bot usage and device telemetry from the rollup tables.")
+    parser.add_argument("report", choices=list(reports))
+    parser.add_argument("--days", type=float, default=7, help="how far back to report")
+    parser.add_argument("--region", help="only count this root topic")
+    parser.add_argument("--node", type=parse_node, help="telemetry: show one node's rollup buckets, e.g. !a1b2c3d4")
+    parser.add_argument("--resolution", choices=["1m", "1h", "1d"], default="1h", help="telemetry: which rollup to read")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print rows as JSON")
+    parser.add_argument("--db", default=db_file_path)
+    args = parser.parse_args()
+
+    now = int(time.time())
+    since = now - now % 3600 - int(args.days * 86400)
+
+    conn = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    try:
+        columns, rows = reports[args.report](conn.cursor(), read_table_prefix(), since, args)
+    except sqlite3.OperationalError as e:
+        sys.exit(f"No {args.report} data yet: {e}")
+    finally:
+        conn.close()
+
+    if args.json:
+        print(json.dumps([dict(zip(columns, row)) for row in rows], ensure_ascii=False))
+    else:
+        print_table(columns, rows)
@@ -19,3 +19,95 @@ class Node:
     def node_list_disp(self):
         return f"{self.user_id} {self.short_padded} | {self.long_name}"
     
+
+class NodeRecord:
+    """Compact per-node record; __slots__ avoids a per-instance __dict__."""
+    __slots__ = ("node_num", "short_name", "long_name", "hw_model", "last_seen", "region_index")
+
+    def __init__(self, node_num: int, short_name: str = "", long_name: str = "", hw_model: int = 0,
+                 last_seen: int = 0, region_index: int = -1):
+        self.node_num = node_num
+        self.short_name = short_name
+        self.long_name = long_name
+        self.hw_model = hw_model
+        self.last_seen = last_seen
+        self.region_index = region_index
+
+    @property
+    def user_id(self) -> str:
+        return '!%08x' % self.node_num
+
+    def to_node(self) -> Node:
+        return Node(self.user_id, self.short_name, self.long_name)
+
+
+class NodeRegistry:
+    """
+    Known nodes keyed by uint32 node number.
+    Regions are interned once and records keep only the index of the last region seen.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.regions = []
+        self._region_index = {}
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __contains__(self, node_num: int) -> bool:
+        return node_num in self.nodes
+
+    def get(self, node_num: int):
+        return self.nodes.get(node_num)
+
+    def _record(self, node_num: int) -> NodeRecord:
+        record = self.nodes.get(node_num)
+        if record is None:
+            record = self.nodes[node_num] = NodeRecord(node_num)
+        return record
+
+    def update(self, node_num: int, short_name: str = None, long_name: str = None, hw_model: int = None) -> NodeRecord:
+        """Set names / hardware model for a node, creating it if needed."""
+        record = self._record(node_num)
+        if short_name is not None:
+            record.short_name = short_name
+        if long_name is not None:
+            record.long_name = long_name
+        if hw_model is not None:
+            record.hw_model = hw_model
+        return record
+
+    def seen(self, node_num: int, region: str, when: int) -> NodeRecord:
+        """Record that a node was heard in a region."""
+        index = self._region_index.get(region)
+        if index is None:
+            index = self._region_index[region] = len(self.regions)
+            self.regions.append(region)
+
+        record = self._record(node_num)
+        record.region_index = index
+        record.last_seen = when
+        return record
+
+    def region_of(self, node_num: int):
+        """Return the region a node was last seen in, or None."""
+        record = self.nodes.get(node_num)
+        if record is None or record.region_index < 0:
+            return None
+        return self.regions[record.region_index]
+
+    def add_node(self, node: Node) -> NodeRecord:
+        """Import a display Node, keyed by the number in its '!xxxxxxxx' user_id."""
+        return self.update(int(node.user_id.lstrip('!'), 16), node.short_name, node.long_name)
+
+    def to_node(self, node_num: int):
+        record = self.nodes.get(node_num)
+        return record.to_node() if record is not None else None
+
+    def prune(self, older_than: int) -> int:
+        """Forget nodes not seen since older_than, returning how many were removed."""
+        stale = [node_num for node_num, record in list(self.nodes.items()) if record.last_seen < older_than]
+        for node_num in stale:
+            del self.nodes[node_num]
+        return len(stale)
@@ -6,175 +6,330 @@ A simple bot that responds to direct messages with random fortunes from fortunes
 """
 
 #### Imports
-try:
-    from meshtastic.protobuf import mesh_pb2, mqtt_pb2, portnums_pb2, telemetry_pb2
-    from meshtastic import BROADCAST_NUM
-except ImportError:
-    from meshtastic import mesh_pb2, mqtt_pb2, portnums_pb2, telemetry_pb2, BROADCAST_NUM
-
 import random
 import threading
 import sqlite3
 import time
-import ssl
 import string
 import sys
 import configparser
+import importlib
+import importlib.util
 from datetime import datetime
-from time import mktime
 from typing import Optional
 import base64
+import gc
+import hashlib
 import json
 import re
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
+import signal
+import ssl
+import os
+from types import MappingProxyType, ModuleType
+from collections import OrderedDict, deque
 import paho.mqtt.client as mqtt
 
-from models import Node
+BROADCAST_NUM = 0xFFFFFFFF
+
+def import_protobufs(*names):
+    """Import meshtastic's generated protobuf modules without running meshtastic/__init__.
+
+    The package __init__ pulls in the serial, BLE and CLI stacks, which we never use.
+    Falls back to a normal import if the slim path does not work for this install.
+    """
+    spec = importlib.util.find_spec("meshtastic")
+    if spec is None or not spec.submodule_search_locations:
+        raise ImportError("meshtastic is not installed")
+
+    package_dirs = list(spec.submodule_search_locations)
+    stubs = {
+        "meshtastic": package_dirs,
+        "meshtastic.protobuf": [os.path.join(path, "protobuf") for path in package_dirs],
+    }
+    added = []
+    for package, path in stubs.items():
+        if package not in sys.modules:
+            stub = ModuleType(package)
+            stub.__path__ = path
+            sys.modules[package] = stub
+            added.append(package)
+
+    try:
+        try:
+            return [importlib.import_module("meshtastic.protobuf." + name) for name in names]
+        except ImportError:
+            # Older releases keep the generated modules at the package root
+            return [importlib.import_module("meshtastic." + name) for name in names]
+    except ImportError:
+        for package in added:
+            sys.modules.pop(package, None)
+        for name in names:
+            sys.modules.pop("meshtastic.protobuf." + name, None)
+            sys.modules.pop("meshtastic." + name, None)
+        try:
+            importlib.import_module("meshtastic.protobuf")
+            return [importlib.import_module("meshtastic.protobuf." + name) for name in names]
+        except ImportError:
+            return [importlib.import_module("meshtastic." + name) for name in names]
+
+mesh_pb2, mqtt_pb2, portnums_pb2, telemetry_pb2 = import_protobufs("mesh_pb2", "mqtt_pb2", "portnums_pb2", "telemetry_pb2")
+
+from models import Node, NodeRegistry
+from geo import geohash_encode
+from tables import build_legacy_table_prefix, build_table_prefix
 
 # Node-Topic tracking
-node_topic_map = {}  # Track which topic each node was last seen on
+node_registry = NodeRegistry()  # Names and last-seen region per node number
+
+def topic_region(topic):
+    """Return the configured root topic that a full MQTT topic was received on."""
+    region = None
+    for root in root_topics:
+        if topic.startswith(root) and (region is None or len(root) > len(region)):
+            region = root
+    return region
 
 def update_node_topic(node_id, topic):
     """Update which topic a node was last seen on."""
-    node_topic_map[node_id] = topic
+    region = topic_region(topic)
+    if region is None:
+        return
+    node_registry.seen(node_id, region, int(time.time()))
     if debug:
-        print(f"Updated node {node_id} last seen topic to: {topic}")
+        print(f"Updated node {node_id} last seen topic to: {region}")
         
-def get_node_topic_for_direct_message(destination_id):
+def get_node_topic_for_direct_message(destination_id, config=None):
     """Get the topic where a node was last seen, formatted for sending direct messages."""
-    base_topic = node_topic_map.get(destination_id, None)
+    config = config or current_config
+    region = node_registry.region_of(destination_id)
     
-    if base_topic:
-        # Extract root topic and reconstruct with OUR node ID in recipient's region
-        # base_topic format: "msh/US/VA/RVA/2/e/LongFast/!somenode"
-        topic_parts = base_topic.split('/')
-        if len(topic_parts) >= 6:
-            root_topic_part = '/'.join(topic_parts[:5]) + '/'
-            our_node_hex = '!' + hex(node_number)[2:]  # Use OUR node ID, not destination
-            direct_topic = root_topic_part + channel + "/" + our_node_hex
-            if debug:
-                print(f"Converted base topic {base_topic} to direct topic {direct_topic} for node {destination_id}")
-            return direct_topic
+    if region:
+        # Reconstruct with OUR node ID in recipient's region
+        direct_topic = region + config["channel"] + "/" + config["node_name"]
+        if debug:
+            print(f"Using direct topic {direct_topic} for node {destination_id}")
+        return direct_topic
     
     return None
 
 def get_node_topic(node_id):
-    """Get the topic where a node was last seen."""
-    topic = node_topic_map.get(node_id, None)
+    """Get the root topic where a node was last seen."""
+    topic = node_registry.region_of(node_id)
     if debug:
         print(f"Node {node_id} last seen on topic: {topic}")
     return topic
 
-def load_config():
-    """Load configuration from config.ini file."""
-    global mqtt_broker, mqtt_port, mqtt_username, mqtt_password, root_topic, root_topics, channel, key
-    global node_number, client_long_name, client_short_name, lat, lon, alt
-    global debug, auto_reconnect, auto_reconnect_delay
-    global print_service_envelope, print_message_packet, print_text_message, print_node_info
-    global print_telemetry, print_failed_encryption_packet, print_position_report, color_text
-    global display_encrypted_emoji, display_dm_emoji, display_lookup_button, display_private_dms
-    global record_locations, node_info_interval_minutes
-    
+# (global name, config.ini option, type, fallback)
+CONFIG_SETTINGS = [
+    # MQTT Connection Settings
+    ("mqtt_broker", "mqtt_broker", str, "mqtt.meshtastic.org"),
+    ("mqtt_port", "mqtt_port", int, 1883),
+    ("mqtt_username", "mqtt_username", str, "meshdev"),
+    ("mqtt_password", "mqtt_password", str, "large4cats"),
+    ("root_topic_config", "root_topic", str, "msh/US/2/e/"),
+    ("channel", "channel", str, "LongFast"),
+    ("key", "key", str, "AQ=="),
+
+    # Node Settings
+    ("node_number", "node_number", int, 2882380807),
+    ("client_long_name", "long_name", str, "FortuneBot"),
+    ("client_short_name", "short_name", str, "FB"),
+
+    # Position Settings
+    ("lat", "lat", str, ""),
+    ("lon", "lon", str, ""),
+    ("alt", "alt", str, ""),
+
+    # Debug Settings
+    ("debug", "debug", bool, True),
+    ("auto_reconnect", "auto_reconnect", bool, False),
+    ("auto_reconnect_delay", "auto_reconnect_delay", float, 1.0),
+    ("auto_reconnect_max_delay", "auto_reconnect_max_delay", float, 60.0),
+
+    # Outbound buffering while disconnected
+    ("outbox_size", "outbox_size", int, 100),
+    ("persist_outbox", "persist_outbox", bool, False),
+
+    ("print_service_envelope", "print_service_envelope", bool, False),
+    ("print_message_packet", "print_message_packet", bool, False),
+    ("print_text_message", "print_text_message", bool, False),
+    ("print_node_info", "print_node_info", bool, False),
+    ("print_telemetry", "print_telemetry", bool, False),
+    ("print_failed_encryption_packet", "print_failed_encryption_packet", bool, False),
+    ("print_position_report", "print_position_report", bool, False),
+    ("color_text", "color_text", bool, False),
+    ("display_encrypted_emoji", "display_encrypted_emoji", bool, True),
+    ("display_dm_emoji", "display_dm_emoji", bool, True),
+    ("display_lookup_button", "display_lookup_button", bool, False),
+    ("display_private_dms", "display_private_dms", bool, False),
+    ("record_locations", "record_locations", bool, False),
+    ("position_flush_interval", "position_flush_interval", float, 30.0),
+    ("position_history_interval_minutes", "position_history_interval_minutes", int, 15),
+    ("record_telemetry", "record_telemetry", bool, False),
+    ("telemetry_flush_interval", "telemetry_flush_interval", float, 60.0),
+    ("telemetry_raw_retention_days", "telemetry_raw_retention_days", int, 7),
+    ("telemetry_minute_retention_days", "telemetry_minute_retention_days", int, 30),
+
+    # Node Info Settings
+    ("node_info_interval_minutes", "node_info_interval_minutes", int, 15),
+
+    # Rate Limiting Settings
+    ("fortune_reply_delay", "fortune_reply_delay", float, 8.0),
+    ("sender_rate_per_minute", "sender_rate_per_minute", float, 2.0),
+    ("sender_burst", "sender_burst", int, 3),
+    ("global_fortunes_per_minute", "global_fortunes_per_minute", float, 30.0),
+    ("max_tracked_senders", "max_tracked_senders", int, 1024),
+    ("max_pending_replies", "max_pending_replies", int, 50),
+
+    # Delivery Tracking Settings
+    ("ack_timeout", "ack_timeout", float, 15.0),
+    ("max_retransmits", "max_retransmits", int, 3),
+    ("max_pending_acks", "max_pending_acks", int, 256),
+
+    # NodeInfo Request Settings
+    ("nodeinfo_request_ttl_minutes", "nodeinfo_request_ttl_minutes", int, 60),
+    ("nodeinfo_round_interval", "nodeinfo_round_interval", float, 10.0),
+    ("nodeinfo_requests_per_round", "nodeinfo_requests_per_round", int, 5),
+    ("nodeinfo_requests_per_minute", "nodeinfo_requests_per_minute", float, 20.0),
+    ("max_pending_nodeinfo_requests", "max_pending_nodeinfo_requests", int, 200),
+
+    # Fortune Encoding Settings
+    ("compress_fortunes", "compress_fortunes", bool, False),
+    ("split_long_fortunes", "split_long_fortunes", bool, True),
+    ("keyword_fortunes", "keyword_fortunes", bool, False),
+
+    # Routing Persistence Settings
+    ("routing_flush_interval", "routing_flush_interval", float, 60.0),
+
+    # Usage Statistics Settings
+    ("usage_flush_interval", "usage_flush_interval", float, 60.0),
+
+    # Status API Settings
+    ("status_api_enabled", "status_api_enabled", bool, False),
+    ("status_api_host", "status_api_host", str, "127.0.0.1"),
+    ("status_api_port", "status_api_port", int, 8765),
+    ("status_refresh_interval", "status_refresh_interval", float, 5.0),
+
+    # Message Retention Settings
+    ("message_retention_days", "message_retention_days", int, 0),
+    ("region_retention_config", "region_retention_days", str, ""),
+    ("migration_chunk_size", "migration_chunk_size", int, 500),
+
+    # Memory Budget Settings
+    ("memory_budget_mb", "memory_budget_mb", int, 0),
+    ("memory_check_interval", "memory_check_interval", float, 30.0),
+    ("memory_tracemalloc", "memory_tracemalloc", bool, False),
+
+    # Config Reload Settings
+    ("config_watch_interval", "config_watch_interval", float, 5.0),
+]
+
+def parse_config(path: str = 'config.ini', strict: bool = False) -> MappingProxyType:
+    """Parse config.ini into a read-only settings snapshot, including derived values.
+    With strict, errors are raised instead of falling back to defaults."""
     config = configparser.ConfigParser()
-    
+    settings = {}
+
     try:
-        config.read('config.ini')
-        
-        # MQTT Connection Settings
-        mqtt_broker = config.get('DEFAULT', 'mqtt_broker', fallback='mqtt.meshtastic.org')
-        mqtt_port = config.getint('DEFAULT', 'mqtt_port', fallback=1883)
-        mqtt_username = config.get('DEFAULT', 'mqtt_username', fallback='meshdev')
-        mqtt_password = config.get('DEFAULT', 'mqtt_password', fallback='large4cats')
-        root_topic_config = config.get('DEFAULT', 'root_topic', fallback='msh/US/2/e/')
-        
-        # Parse comma-separated root topics
-        root_topics = [topic.strip() for topic in root_topic_config.split(',') if topic.strip()]
-        root_topic = root_topics[0] if root_topics else 'msh/US/2/e/'  # Use first topic as primary
-        
-        channel = config.get('DEFAULT', 'channel', fallback='LongFast')
-        key = config.get('DEFAULT', 'key', fallback='AQ==')
-        
-        # Node Settings
-        node_number = config.getint('DEFAULT', 'node_number', fallback=2882380807)
-        client_long_name = config.get('DEFAULT', 'long_name', fallback='FortuneBot')
-        client_short_name = config.get('DEFAULT', 'short_name', fallback='FB')
-        
-        # Position Settings
-        lat = config.get('DEFAULT', 'lat', fallback='')
-        lon = config.get('DEFAULT', 'lon', fallback='')
-        alt = config.get('DEFAULT', 'alt', fallback='')
-        
-        # Debug Settings
-        debug = config.getboolean('DEFAULT', 'debug', fallback=True)
-        auto_reconnect = config.getboolean('DEFAULT', 'auto_reconnect', fallback=False)
-        auto_reconnect_delay = config.getfloat('DEFAULT', 'auto_reconnect_delay', fallback=1.0)
-        
-        print_service_envelope = config.getboolean('DEFAULT', 'print_service_envelope', fallback=False)
-        print_message_packet = config.getboolean('DEFAULT', 'print_message_packet', fallback=False)
-        print_text_message = config.getboolean('DEFAULT', 'print_text_message', fallback=False)
-        print_node_info = config.getboolean('DEFAULT', 'print_node_info', fallback=False)
-        print_telemetry = config.getboolean('DEFAULT', 'print_telemetry', fallback=False)
-        print_failed_encryption_packet = config.getboolean('DEFAULT', 'print_failed_encryption_packet', fallback=False)
-        print_position_report = config.getboolean('DEFAULT', 'print_position_report', fallback=False)
-        color_text = config.getboolean('DEFAULT', 'color_text', fallback=False)
-        display_encrypted_emoji = config.getboolean('DEFAULT', 'display_encrypted_emoji', fallback=True)
-        display_dm_emoji = config.getboolean('DEFAULT', 'display_dm_emoji', fallback=True)
-        display_lookup_button = config.getboolean('DEFAULT', 'display_lookup_button', fallback=False)
-        display_private_dms = config.getboolean('DEFAULT', 'display_private_dms', fallback=False)
-        record_locations = config.getboolean('DEFAULT', 'record_locations', fallback=False)
-        
-        # Node Info Settings
-        node_info_interval_minutes = config.getint('DEFAULT', 'node_info_interval_minutes', fallback=15)
-        
-        if debug:
-            print("Configuration loaded from config.ini")
-            
+        if not config.read(path) and strict:
+            raise FileNotFoundError(path)
+        for name, option, value_type, fallback in CONFIG_SETTINGS:
+            if value_type is bool:
+                settings[name] = config.getboolean('DEFAULT', option, fallback=fallback)
+            elif value_type is int:
+                settings[name] = config.getint('DEFAULT', option, fallback=fallback)
+            elif value_type is float:
+                settings[name] = config.getfloat('DEFAULT', option, fallback=fallback)
+            else:
+                settings[name] = config.get('DEFAULT', option, fallback=fallback)
+
     except Exception as e:
+        if strict:
+            raise
         print(f"Error loading config.ini: {str(e)}")
         print("Using default configuration values")
-        
+
         # Set defaults if config file fails to load
-        mqtt_broker = "mqtt.meshtastic.org"
-        mqtt_port = 1883
-        mqtt_username = "meshdev"
-        mqtt_password = "large4cats"
-        root_topics = ["msh/US/2/e/"]
-        root_topic = "msh/US/2/e/"
-        channel = "LongFast"
-        key = "AQ=="
-        node_number = 2882380807
-        client_long_name = "FortuneBot"
-        client_short_name = "FB"
-        lat = ""
-        lon = ""
-        alt = ""
-        debug = True
-        auto_reconnect = False
-        auto_reconnect_delay = 1.0
-        print_service_envelope = False
-        print_message_packet = False
-        print_text_message = False
-        print_node_info = False
-        print_telemetry = False
-        print_failed_encryption_packet = False
-        print_position_report = False
-        color_text = False
-        display_encrypted_emoji = True
-        display_dm_emoji = True
-        display_lookup_button = False
-        display_private_dms = False
-        record_locations = False
-        node_info_interval_minutes = 15
+        settings = {name: fallback for name, option, value_type, fallback in CONFIG_SETTINGS}
+
+    # Parse comma-separated root topics
+    root_topics = [topic.strip() for topic in settings.pop("root_topic_config").split(',') if topic.strip()]
+    settings["root_topics"] = tuple(root_topics) if root_topics else ('msh/US/2/e/',)
+    settings["root_topic"] = settings["root_topics"][0]  # Use first topic as primary
+
+    if ':' in settings["mqtt_broker"]:
+        broker, port = settings["mqtt_broker"].split(':')
+        settings["mqtt_broker"] = broker
+        settings["mqtt_port"] = int(port)
+
+    # Derived values, rebuilt on every reload instead of per packet
+    key = settings["key"]
+    if key == "AQ==":
+        key = default_key
+    if key:
+        key = key.ljust(len(key) + ((4 - (len(key) % 4)) % 4), '=').replace('-', '+').replace('_', '/')
+    settings["key"] = key
+    settings["key_bytes"] = base64.b64decode(key.encode('ascii'))
+    settings["channel_hash"] = generate_hash(settings["channel"], key)
+    settings["node_name"] = '!' + hex(settings["node_number"])[2:]
+    settings["subscribe_topics"] = tuple(topic + settings["channel"] + "/#" for topic in settings["root_topics"])
+    settings["publish_topic"] = settings["root_topic"] + settings["channel"] + "/" + settings["node_name"]
+
+    settings["table_prefix"] = build_table_prefix(settings["mqtt_broker"], settings["channel"])
+    # Older versions named tables after whichever root topic was listed first
+    settings["legacy_table_prefixes"] = tuple(build_legacy_table_prefix(settings["mqtt_broker"], topic, settings["channel"])
+                                              for topic in settings["root_topics"])
+
+    # Parse "region=days" pairs overriding message_retention_days
+    region_retention = {}
+    for pair in settings.pop("region_retention_config").split(','):
+        region, _, days = pair.strip().rpartition('=')
+        if region and days.strip().isdigit():
+            region_retention[region.strip()] = int(days)
+    settings["region_retention"] = MappingProxyType(region_retention)
+    # Options present in the file, so a reload can tell a half-written file from a deliberate edit
+    settings["config_options"] = frozenset(config['DEFAULT'])
+
+    return MappingProxyType(settings)
+
+def load_config(new_config=None):
+    """Load configuration from config.ini file."""
+    global current_config
+    if new_config is None:
+        new_config = parse_config()
+    # Each setting is replaced in one dict update, but a function reading several globals can still
+    # straddle a reload; code where settings must agree (packet building) reads one current_config instead
+    globals().update(new_config)
+    current_config = new_config
+
+    if debug:
+        print("Configuration loaded from config.ini")
+
+# Settings from config.ini and values derived from them, all assigned by load_config()
+current_config = None
+mqtt_broker = mqtt_port = mqtt_username = mqtt_password = channel = key = node_number = None
+client_long_name = client_short_name = lat = lon = alt = debug = auto_reconnect = auto_reconnect_delay = None
+auto_reconnect_max_delay = outbox_size = persist_outbox = print_service_envelope = print_message_packet = None
+print_text_message = print_node_info = print_telemetry = print_failed_encryption_packet = None
+print_position_report = color_text = display_encrypted_emoji = display_dm_emoji = display_lookup_button = None
+display_private_dms = record_locations = position_flush_interval = position_history_interval_minutes = None
+record_telemetry = telemetry_flush_interval = telemetry_raw_retention_days = None
+telemetry_minute_retention_days = node_info_interval_minutes = fortune_reply_delay = None
+sender_rate_per_minute = sender_burst = global_fortunes_per_minute = max_tracked_senders = None
+max_pending_replies = ack_timeout = max_retransmits = max_pending_acks = nodeinfo_request_ttl_minutes = None
+nodeinfo_round_interval = nodeinfo_requests_per_round = nodeinfo_requests_per_minute = None
+max_pending_nodeinfo_requests = compress_fortunes = split_long_fortunes = keyword_fortunes = None
+routing_flush_interval = usage_flush_interval = status_api_enabled = status_api_host = status_api_port = None
+status_refresh_interval = message_retention_days = migration_chunk_size = memory_budget_mb = None
+memory_check_interval = memory_tracemalloc = config_watch_interval = root_topics = root_topic = None
+key_bytes = channel_hash = node_name = subscribe_topics = publish_topic = table_prefix = None
+legacy_table_prefixes = region_retention = config_options = None
 
 # Program variables
 default_key = "1PG7OiApB1nwvP+rz05pAQ==" # AKA AQ==
 db_file_path = "fortune.db"
 reserved_ids = [1,2,3,4,4294967295]
 
-# Load configuration from config.ini
-load_config()
-
 # Additional variables that depend on config
 max_msg_len = mesh_pb2.Constants.DATA_PAYLOAD_LEN
 key_emoji = "\U0001F511"
@@ -200,23 +355,6 @@ def is_valid_hex(test_value: str, minchars: Optional[int], maxchars: int) -> boo
 
     return valid_hex_return
 
-def set_topic():
-    """Set the MQTT topics for subscribing and publishing."""
-    if debug:
-        print("set_topic")
-    global subscribe_topics, publish_topic, node_number, node_name, root_topics
-    node_name = '!' + hex(node_number)[2:]
-    
-    # Create subscription topics for all root topics
-    subscribe_topics = [topic + channel + "/#" for topic in root_topics]
-    
-    # Use the first root topic for publishing
-    publish_topic = root_topics[0] + channel + "/" + node_name
-    
-    if debug:
-        print(f"Subscribe topics: {subscribe_topics}")
-        print(f"Publish topic: {publish_topic}")
-
 def current_time() -> str:
     """Return the current time as a string."""
     return str(int(time.time()))
@@ -254,25 +392,27 @@ def get_name_by_id(name_type: str, user_id: str) -> str:
     """Get name for the given user_id."""
     hex_user_id: str = '!%08x' % user_id
 
+    record = node_registry.get(user_id)
+    if record is not None and record.short_name:
+        return record.long_name if name_type == "long" else record.short_name
+
     try:
-        table_name = sanitize_string(mqtt_broker) + "_" + sanitize_string(root_topic) + sanitize_string(channel) + "_nodeinfo"
+        table_name = table_prefix + "_nodeinfo"
         with sqlite3.connect(db_file_path) as db_connection:
             db_cursor = db_connection.cursor()
 
-            if name_type == "long":
-                result = db_cursor.execute(f'SELECT long_name FROM {table_name} WHERE user_id=?', (hex_user_id,)).fetchone()
-            if name_type == "short":
-                result = db_cursor.execute(f'SELECT short_name FROM {table_name} WHERE user_id=?', (hex_user_id,)).fetchone()
+            result = db_cursor.execute(f'SELECT short_name, long_name FROM {table_name} WHERE user_id=?', (hex_user_id,)).fetchone()
 
             if result:
                 if debug:
                     print("found user in db: " + str(hex_user_id))
-                return result[0]
+                node_registry.update(user_id, short_name=result[0], long_name=result[1])
+                return result[1] if name_type == "long" else result[0]
             else:
                 if user_id != BROADCAST_NUM:
                     if debug:
                         print("didn't find user in db: " + str(hex_user_id))
-                    send_node_info(user_id, want_response=True)
+                    request_node_info(user_id)
                 return f"Unknown User ({hex_user_id})"
 
     except sqlite3.Error as e:
@@ -281,12 +421,117 @@ def get_name_by_id(name_type: str, user_id: str) -> str:
     finally:
         db_connection.close()
 
-def sanitize_string(input_str: str) -> str:
-    """Sanitize string for database table names."""
-    if not re.match(r'^[a-zA-Z_]', input_str):
-        input_str = '_' + input_str
-    sanitized_str: str = re.sub(r'[^a-zA-Z0-9_]', '_', input_str)
-    return sanitized_str
+def flush_routing():
+    """Persist routing entries that changed since the last flush."""
+    global routing_flushed_at
+    since = routing_flushed_at
+    routing_flushed_at = int(time.time())
+    rows = [(record.node_num, node_registry.regions[record.region_index], record.last_seen)
+            for record in list(node_registry.nodes.values())
+            if record.last_seen >= since and record.region_index >= 0]
+    if not rows:
+        return
+
+    table_name = table_prefix + "_routing"
+    try:
+        with sqlite3.connect(db_file_path) as db_connection:
+            db_connection.executemany(f'INSERT OR REPLACE INTO {table_name} (node_num, region, last_seen) VALUES (?,?,?)', rows)
+            db_connection.commit()
+            if debug:
+                print(f"Stored {len(rows)} routing entries")
+    except sqlite3.Error as e:
+        print(f"SQLite error in flush_routing: {e}")
+    finally:
+        db_connection.close()
+
+def load_routing_from_db():
+    """Restore where nodes were last seen so DMs route correctly right after a restart."""
+    table_name = table_prefix + "_routing"
+    try:
+        with sqlite3.connect(db_file_path) as db_connection:
+            for node_num, region, last_seen in db_connection.execute(f'SELECT node_num, region, last_seen FROM {table_name}'):
+                node_registry.seen(node_num, region, last_seen)
+    except sqlite3.Error as e:
+        print(f"SQLite error in load_routing_from_db: {e}")
+    finally:
+        db_connection.close()
+
+def flush_routing_periodically() -> None:
+    """Function to persist the routing table in a separate thread."""
+    while True:
+        time.sleep(routing_flush_interval)
+        flush_routing()
+
+# NodeInfo request scheduling
+nodeinfo_requests = OrderedDict()  # node number -> None, waiting for the next round
+nodeinfo_asked = OrderedDict()  # node number -> time we last asked, oldest first
+nodeinfo_cond = threading.Condition()
+
+def request_node_info(node_id):
+    """Ask for a node's NodeInfo in the next scheduler round unless it is already pending or was asked recently."""
+    now = time.monotonic()
+    with nodeinfo_cond:
+        if node_id in nodeinfo_requests:
+            return
+
+        asked = nodeinfo_asked.get(node_id)
+        if asked is not None and now - asked < nodeinfo_request_ttl_minutes * 60:
+            if debug:
+                print(f"NodeInfo for {node_id} requested recently, not asking again")
+            return
+
+        if len(nodeinfo_requests) >= max_pending_nodeinfo_requests:
+            if debug:
+                print(f"NodeInfo request queue full, skipping {node_id}")
+            return
+
+        nodeinfo_requests[node_id] = None
+        nodeinfo_cond.notify()
+
+def forget_node_info_request(node_id):
+    """Drop a pending request once the node's NodeInfo has arrived on its own."""
+    with nodeinfo_cond:
+        nodeinfo_requests.pop(node_id, None)
+
+def node_info_scheduler():
+    """Function to send queued NodeInfo requests in paced rounds in a separate thread."""
+    bucket = [max(1.0, nodeinfo_requests_per_minute), time.monotonic()]
+    while True:
+        with nodeinfo_cond:
+            while not nodeinfo_requests:
+                nodeinfo_cond.wait()
+
+            now = time.monotonic()
+            # Expire the negative cache from the oldest end
+            while nodeinfo_asked and now - next(iter(nodeinfo_asked.values())) >= nodeinfo_request_ttl_minutes * 60:
+                nodeinfo_asked.popitem(last=False)
+
+            refill_bucket(bucket, nodeinfo_requests_per_minute, max(1.0, nodeinfo_requests_per_minute), now)
+            batch = []
+            while nodeinfo_requests and len(batch) < nodeinfo_requests_per_round and bucket[0] >= 1.0:
+                node_id, _ = nodeinfo_requests.popitem(last=False)
+                bucket[0] -= 1.0
+                batch.append(node_id)
+
+        if client.is_connected():
+            for node_id in batch:
+                send_node_info(node_id, want_response=True)
+            # Only nodes we actually asked go into the negative cache
+            with nodeinfo_cond:
+                for node_id in batch:
+                    nodeinfo_asked.pop(node_id, None)
+                    nodeinfo_asked[node_id] = time.monotonic()
+        elif batch:
+            # Keep the requests and their tokens for the first round after the broker is back
+            bucket[0] = min(bucket[0] + len(batch), max(1.0, nodeinfo_requests_per_minute))
+            with nodeinfo_cond:
+                for node_id in reversed(batch):
+                    nodeinfo_requests[node_id] = None
+                    nodeinfo_requests.move_to_end(node_id, last=False)
+            if debug:
+                print(f"Not connected, deferred {len(batch)} NodeInfo request(s)")
+
+        time.sleep(nodeinfo_round_interval)
 
 def on_message(client, userdata, msg):
     """Callback function that accepts a meshtastic message from mqtt."""
@@ -311,6 +556,11 @@ def on_message(client, userdata, msg):
             print('Message too long: ' + str(len(msg.payload)) + ' bytes long, skipping.')
         return
 
+    if shedding_broadcasts and getattr(mp, "to") != node_number:
+        # Over the memory budget: skip everything not addressed to us before decrypting it
+        memory_stats["shed_packets"] += 1
+        return
+
     if mp.HasField("encrypted") and not mp.HasField("decoded"):
         decode_encrypted(mp)
         is_encrypted=True
@@ -330,6 +580,48 @@ def on_message(client, userdata, msg):
         except Exception as e:
             print(f"*** TEXT_MESSAGE_APP: {str(e)}")
 
+    elif mp.decoded.portnum == portnums_pb2.TEXT_MESSAGE_COMPRESSED_APP:
+        # Never decompressed: unishox2 decoders do not bound their output, so a crafted packet can overrun the buffer.
+        # A compressed DM to us still gets a (random) fortune.
+        if getattr(mp, "to") == node_number:
+            try:
+                process_message(mp, "", is_encrypted)
+            except Exception as e:
+                print(f"*** TEXT_MESSAGE_COMPRESSED_APP: {str(e)}")
+
+    elif mp.decoded.portnum == portnums_pb2.ROUTING_APP:
+        if getattr(mp, "to") == node_number and mp.decoded.request_id:
+            routing = mesh_pb2.Routing()
+            try:
+                routing.ParseFromString(mp.decoded.payload)
+                handle_routing_ack(mp.decoded.request_id, routing.error_reason)
+            except Exception as e:
+                print(f"*** ROUTING_APP: {str(e)}")
+
+    elif mp.decoded.portnum == portnums_pb2.POSITION_APP:
+        position = mesh_pb2.Position()
+        try:
+            position.ParseFromString(mp.decoded.payload)
+            if print_position_report:
+                print("Position:")
+                print(position)
+            if record_locations:
+                queue_position(from_node, position)
+        except Exception as e:
+            print(f"*** POSITION_APP: {str(e)}")
+
+    elif mp.decoded.portnum == portnums_pb2.TELEMETRY_APP:
+        telemetry = telemetry_pb2.Telemetry()
+        try:
+            telemetry.ParseFromString(mp.decoded.payload)
+            if print_telemetry:
+                print("Telemetry:")
+                print(telemetry)
+            if record_telemetry and telemetry.HasField("device_metrics"):
+                queue_telemetry(from_node, telemetry.device_metrics)
+        except Exception as e:
+            print(f"*** TELEMETRY_APP: {str(e)}")
+
     elif mp.decoded.portnum == portnums_pb2.NODEINFO_APP:
         info = mesh_pb2.User()
         try:
@@ -341,15 +633,19 @@ def on_message(client, userdata, msg):
         except Exception as e:
             print(f"*** NODEINFO_APP: {str(e)}")
 
+def aes_ctr_cipher(nonce, cipher_key):
+    """Build an AES-CTR cipher for the channel key, importing cryptography on first use."""
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    return Cipher(algorithms.AES(cipher_key), modes.CTR(nonce))
+
 def decode_encrypted(mp):
     """Decrypt a meshtastic message."""
     try:
-        key_bytes = base64.b64decode(key.encode('ascii'))
         nonce_packet_id = getattr(mp, "id").to_bytes(8, "little")
         nonce_from_node = getattr(mp, "from").to_bytes(8, "little")
         nonce = nonce_packet_id + nonce_from_node
 
-        cipher = Cipher(algorithms.AES(key_bytes), modes.CTR(nonce), backend=default_backend())
+        cipher = aes_ctr_cipher(nonce, key_bytes)
         decryptor = cipher.decryptor()
         decrypted_bytes = decryptor.update(getattr(mp, "encrypted")) + decryptor.finalize()
 
@@ -397,19 +693,19 @@ def process_message(mp, text_payload, is_encrypted):
             display_str = f"{format_time(current_time())} DM from {sender_short_name}: {text_payload}"
             if display_dm_emoji:
                 display_str = display_str[:9] + dm_emoji + display_str[9:]
-            if want_ack is True:
-                send_ack(from_node, message_id)
-            
-            # Send fortune response to any direct message
-            if debug:
-                print(f"Sending fortune response to {from_node}")
-            # Send fortune in a separate thread with a delay
-            def delayed_fortune_response():
-                time.sleep(6.0)  # Wait 6 seconds for processing
-                send_fortune(from_node)
-            
-            response_thread = threading.Thread(target=delayed_fortune_response, daemon=True)
-            response_thread.start()
+            count_usage(from_node, "dms")
+            if not take_sender_token(from_node):
+                rate_limit_stats["rejected_sender"] += 1
+                if debug:
+                    print(f"Rate limit exceeded for {from_node}, ignoring DM")
+            else:
+                if want_ack is True:
+                    send_ack(from_node, message_id)
+                
+                # Send fortune response to any direct message
+                if debug:
+                    print(f"Queueing fortune response to {from_node}")
+                queue_fortune(from_node, text_payload)
 
         elif from_node == node_number and to_node != BROADCAST_NUM:
             display_str = f"{format_time(current_time())} DM to {receiver_short_name}: {text_payload}"
@@ -437,7 +733,10 @@ def process_message(mp, text_payload, is_encrypted):
             update_console(display_str, tag=color)
         
         m_id = getattr(mp, "id")
-        insert_message_to_db(current_time(), sender_short_name, text_payload, m_id, is_encrypted)
+        insert_message_to_db(current_time(), sender_short_name, text_payload, m_id, is_encrypted, node_registry.region_of(from_node))
+        if to_node == node_number:
+            recent_messages.append({"time": int(time.time()), "from": '!%08x' % from_node, "short_name": sender_short_name,
+                                    "text": text_payload, "region": node_registry.region_of(from_node)})
 
         if print_text_message:
             text = {
@@ -454,43 +753,195 @@ def process_message(mp, text_payload, is_encrypted):
         if debug:
             print("duplicate message ignored")
 
-def send_fortune(target_id):
-    """Send a random fortune from fortunes.txt."""
+# Fortune corpus
+fortune_corpus = []  # (text, [(portnum, payload, utf-8 length), ...]) with each part already sized for one packet
+fortune_corpus_mtime = None
+fortune_corpus_lock = threading.Lock()
+fortune_index = {}  # word or "#category" -> ids into fortune_corpus, built when keyword_fortunes is on
+fortune_line_cache = {}  # fortunes.txt line -> (text, parts, index keys), so a reload only encodes changed lines
+fortune_tag_pattern = re.compile(r'\s+#([\w-]+)$')
+fortune_stopwords = frozenset("the and for are but not you your yours all any can had has have her his him its our out was were will with what when where who why how this that than then them they there these those from into just about would could should been being very".split())
+airtime_stats = {"packets": 0, "bytes_sent": 0, "bytes_saved": 0, "compressed_packets": 0, "split_fortunes": 0, "rejected_fortunes": 0}
+
+def load_unishox2():
+    """Return the unishox2 module, or None if compression is disabled or it is not installed."""
+    if not compress_fortunes:
+        return None
+    try:
+        import unishox2
+        return unishox2
+    except ImportError:
+        if debug:
+            print("unishox2 not installed, sending fortunes uncompressed")
+        return None
+
+def text_fits(portnum, payload: bytes) -> bool:
+    """Check whether a payload fits in a single Data packet."""
+    data = mesh_pb2.Data()
+    data.portnum = portnum
+    data.payload = payload
+    data.bitfield = 1
+    return len(data.SerializeToString()) <= max_msg_len
+
+def encode_text(text: str, unishox2):
+    """Return the smaller (portnum, payload, utf-8 length) encoding of text, or None if neither fits in a packet."""
+    plain = text.encode("utf-8")
+    candidates = [(portnums_pb2.TEXT_MESSAGE_APP, plain)]
+    if unishox2 is not None:
+        compressed, _ = unishox2.compress(text)
+        candidates.append((portnums_pb2.TEXT_MESSAGE_COMPRESSED_APP, compressed))
+
+    for portnum, payload in sorted(candidates, key=lambda candidate: len(candidate[1])):
+        if text_fits(portnum, payload):
+            return portnum, payload, len(plain)
+    return None
+
+def split_text(text: str, unishox2) -> list:
+    """Split text on word boundaries into parts that each fit in a packet."""
+    parts = []
+    current = ""
+    for word in text.split():
+        candidate = f"{current} {word}" if current else word
+        if encode_text(candidate, unishox2) is not None:
+            current = candidate
+            continue
+        if not current:
+            # A single word that does not fit on its own
+            return []
+        parts.append(encode_text(current, unishox2))
+        current = word
+    if current:
+        encoded = encode_text(current, unishox2)
+        if encoded is None:
+            return []
+        parts.append(encoded)
+    return parts
+
+def fortune_tokens(text: str) -> set:
+    """Return the lower-case words of text worth matching on, with plural 's' dropped."""
+    tokens = set()
+    for word in re.findall(r"[a-z0-9']+", text.lower()):
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        if len(word) > 2 and word not in fortune_stopwords:
+            tokens.add(word)
+    return tokens
+
+def parse_fortune_line(line: str) -> tuple:
+    """Split trailing #category tags off a fortunes.txt line, returning (text, tags)."""
+    tags = []
+    match = fortune_tag_pattern.search(line)
+    while match:
+        tags.append(match.group(1).lower())
+        line = line[:match.start()]
+        match = fortune_tag_pattern.search(line)
+    return line, tags
+
+def encode_fortune_line(line: str, unishox2) -> tuple:
+    """Return (text, packet parts, index keys) for one fortunes.txt line; parts is empty if it cannot be sent."""
+    text, tags = parse_fortune_line(line)
+    keys = fortune_tokens(text) | {"#" + tag for tag in tags}
+
+    encoded = encode_text(text, unishox2)
+    if encoded is not None:
+        return text, [encoded], keys
+
+    parts = split_text(text, unishox2) if split_long_fortunes else []
+    if parts:
+        airtime_stats["split_fortunes"] += 1
+    else:
+        airtime_stats["rejected_fortunes"] += 1
+        print(f"Fortune too long for one packet, skipping: {text[:40]}...")
+    return text, parts, keys
+
+def load_fortunes() -> list:
+    """Return the fortune corpus, re-encoding and re-indexing only lines that changed in fortunes.txt."""
+    global fortune_corpus, fortune_corpus_mtime, fortune_index, fortune_line_cache
+    mtime = os.stat('fortunes.txt').st_mtime
+    with fortune_corpus_lock:
+        if mtime == fortune_corpus_mtime:
+            return fortune_corpus
+
+        unishox2 = load_unishox2()
+        corpus = []
+        index = {}
+        line_cache = {}
+        with open('fortunes.txt', 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = line_cache.get(line) or fortune_line_cache.get(line)
+                if entry is None:
+                    entry = encode_fortune_line(line, unishox2)
+                line_cache[line] = entry
+
+                text, parts, keys = entry
+                if not text or not parts:
+                    continue
+                if keyword_fortunes:
+                    for key in keys:
+                        index.setdefault(key, []).append(len(corpus))
+                corpus.append((text, parts))
+
+        fortune_corpus = corpus
+        fortune_index = index
+        fortune_line_cache = line_cache
+        fortune_corpus_mtime = mtime
+        if debug:
+            print(f"Loaded {len(corpus)} fortunes, {len(index)} index keys")
+        return corpus
+
+def choose_fortune(fortunes: list, text_payload: str) -> tuple:
+    """Pick a fortune sharing the most words or #categories with the DM, falling back to a random one."""
+    if keyword_fortunes and text_payload:
+        scores = {}
+        for token in fortune_tokens(text_payload):
+            # A category match counts for more than the word merely appearing in the fortune
+            for key, weight in (("#" + token, 2), (token, 1)):
+                for fortune_id in fortune_index.get(key, ()):
+                    scores[fortune_id] = scores.get(fortune_id, 0) + weight
+        if scores:
+            best = max(scores.values())
+            return fortunes[random.choice([fortune_id for fortune_id, score in scores.items() if score == best])]
+    return random.choice(fortunes)
+
+def send_fortune(target_id, text_payload=""):
+    """Send a fortune from fortunes.txt, matched to the DM text when keyword_fortunes is on."""
     if debug:
         print(f"Sending fortune to {target_id}")
 
-    if not client.is_connected():
-        if debug:
-            print("Not connected to MQTT broker, skipping fortune")
-        return
+    if not client.is_connected() and debug:
+        print("Not connected to MQTT broker, fortune will be buffered until reconnect")
 
     try:
-        # Read fortunes from file
-        with open('fortunes.txt', 'r', encoding='utf-8') as f:
-            fortunes = [line.strip() for line in f if line.strip()]
+        fortunes = load_fortunes()
         
         if not fortunes:
             fortune_text = "No fortunes available at this time."
+            parts = [encode_text(fortune_text, None)]
             if debug:
                 print("No fortunes found in file")
         else:
-            # Pick a random fortune
-            fortune_text = random.choice(fortunes)
+            fortune_text, parts = choose_fortune(fortunes, text_payload)
             if debug:
                 print(f"Selected fortune: {fortune_text}")
         
-        encoded_message = mesh_pb2.Data()
-        encoded_message.portnum = portnums_pb2.TEXT_MESSAGE_APP
-        encoded_message.payload = fortune_text.encode("utf-8")
-        encoded_message.bitfield = 1
-        
         if debug:
             print(f"Sending fortune to {target_id}: {fortune_text}")
         
-        # Add delay for processing before sending
-        time.sleep(2.0)
-        
-        generate_mesh_packet(target_id, encoded_message)
+        for portnum, payload, plain_length in parts:
+            encoded_message = mesh_pb2.Data()
+            encoded_message.portnum = portnum
+            encoded_message.payload = payload
+            encoded_message.bitfield = 1
+            generate_mesh_packet(target_id, encoded_message)
+
+            airtime_stats["packets"] += 1
+            airtime_stats["bytes_sent"] += len(payload)
+            if portnum == portnums_pb2.TEXT_MESSAGE_COMPRESSED_APP:
+                airtime_stats["compressed_packets"] += 1
+                airtime_stats["bytes_saved"] += plain_length - len(payload)
         
         if debug:
             print(f"Fortune sent to {target_id}")
@@ -503,12 +954,329 @@ def send_fortune(target_id):
     except Exception as e:
         print(f"Error sending fortune: {str(e)}")
 
+# Rate limiting
+sender_buckets = OrderedDict()  # node number -> [tokens, last refill time], least recently seen first
+pending_fortunes = OrderedDict()  # node number -> [time the fortune is due, latest DM text]
+pending_fortunes_cond = threading.Condition()
+rate_limit_stats = {"rejected_sender": 0, "rejected_overload": 0, "coalesced": 0, "sent": 0}
+
+def refill_bucket(bucket, rate_per_minute: float, burst: float, now: float) -> None:
+    """Top up a [tokens, last refill time] token bucket in place."""
+    bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate_per_minute / 60.0)
+    bucket[1] = now
+
+def take_sender_token(node_id) -> bool:
+    """Spend one token from the sender's bucket, False if the sender is over its limit."""
+    now = time.monotonic()
+    with pending_fortunes_cond:
+        bucket = sender_buckets.pop(node_id, None)
+        if bucket is None:
+            bucket = [float(sender_burst), now]
+            if len(sender_buckets) >= max_tracked_senders:
+                # Forget the sender we heard from least recently
+                sender_buckets.popitem(last=False)
+        sender_buckets[node_id] = bucket
+
+        refill_bucket(bucket, sender_rate_per_minute, sender_burst, now)
+        if bucket[0] < 1.0:
+            return False
+        bucket[0] -= 1.0
+        return True
+
+def take_global_token() -> float:
+    """Spend one token from the global outbound bucket, returning seconds to wait if empty. Caller holds pending_fortunes_cond."""
+    if global_fortunes_per_minute <= 0:
+        # 0 means no global cap, like the other 0-disables settings
+        return 0.0
+    now = time.monotonic()
+    refill_bucket(global_bucket, global_fortunes_per_minute, max(1.0, global_fortunes_per_minute), now)
+    if global_bucket[0] < 1.0:
+        return (1.0 - global_bucket[0]) * 60.0 / global_fortunes_per_minute
+    global_bucket[0] -= 1.0
+    return 0.0
+
+def queue_fortune(node_id, text_payload=""):
+    """Schedule a fortune for node_id, folding repeat DMs into one reply that answers the latest text."""
+    with pending_fortunes_cond:
+        if node_id in pending_fortunes:
+            pending_fortunes[node_id][1] = text_payload
+            rate_limit_stats["coalesced"] += 1
+            if debug:
+                print(f"Fortune already pending for {node_id}, coalescing DM")
+            return
+
+        if len(pending_fortunes) >= max_pending_replies:
+            rate_limit_stats["rejected_overload"] += 1
+            if debug:
+                print(f"Reply queue full, dropping fortune for {node_id}")
+            return
+
+        pending_fortunes[node_id] = [time.monotonic() + fortune_reply_delay, text_payload]
+        pending_fortunes_cond.notify()
+
+def fortune_reply_worker():
+    """Function to send queued fortunes in a separate thread."""
+    while True:
+        with pending_fortunes_cond:
+            while True:
+                wait = None
+                if pending_fortunes:
+                    # Every reply gets the same delay, so the oldest entry is always due first
+                    node_id, (due, text_payload) = next(iter(pending_fortunes.items()))
+                    wait = due - time.monotonic()
+                    if wait <= 0:
+                        wait = take_global_token()
+                        if wait <= 0:
+                            del pending_fortunes[node_id]
+                            break
+                pending_fortunes_cond.wait(timeout=wait)
+
+        send_fortune(node_id, text_payload)
+        rate_limit_stats["sent"] += 1
+        count_usage(node_id, "fortunes")
+
+# Position recording
+pending_positions = {}  # node number -> (latitude, longitude, altitude, time, region), latest report only
+pending_positions_lock = threading.Lock()
+last_history_time = {}  # node number -> time of the last history row written
+
+def queue_position(node_id, position):
+    """Keep the latest position for a node until the next batch write."""
+    if not position.latitude_i and not position.longitude_i:
+        # No GPS fix
+        return
+
+    latitude = position.latitude_i * 1e-7
+    longitude = position.longitude_i * 1e-7
+    # Use receive time rather than position.time: device clocks are often wrong and the map watermark depends on it
+    reported_time = int(time.time())
+    with pending_positions_lock:
+        pending_positions[node_id] = (latitude, longitude, position.altitude, reported_time, node_registry.region_of(node_id))
+
+def flush_positions():
+    """Write coalesced positions to sqlite in one batch."""
+    global pending_positions
+    with pending_positions_lock:
+        if not pending_positions:
+            return
+        batch = pending_positions
+        pending_positions = {}
+
+    table_name = table_prefix + "_positions"
+    history_table_name = table_prefix + "_position_history"
+    nodeinfo_table_name = table_prefix + "_nodeinfo"
+
+    latest_rows = []
+    history_rows = []
+    for node_id, (latitude, longitude, altitude, reported_time, region) in batch.items():
+        geohash = geohash_encode(latitude, longitude)
+        latest_rows.append((node_id, '!%08x' % node_id, latitude, longitude, altitude, geohash, reported_time, region))
+        # Downsample history to one row per node per interval
+        if position_history_interval_minutes > 0 and reported_time - last_history_time.get(node_id, 0) >= position_history_interval_minutes * 60:
+            last_history_time[node_id] = reported_time
+            history_rows.append((node_id, reported_time, latitude, longitude, altitude, geohash))
+
+    try:
+        with sqlite3.connect(db_file_path) as db_connection:
+            db_cursor = db_connection.cursor()
+            db_cursor.executemany(f'''
+                INSERT OR REPLACE INTO {table_name} (node_num, user_id, short_name, latitude, longitude, altitude, geohash, time, region)
+                VALUES (?1, ?2, (SELECT short_name FROM {nodeinfo_table_name} WHERE user_id=?2), ?3, ?4, ?5, ?6, ?7, ?8)
+            ''', latest_rows)
+            db_cursor.executemany(f'''
+                INSERT INTO {history_table_name} (node_num, time, latitude, longitude, altitude, geohash)
+                VALUES (?,?,?,?,?,?)
+            ''', history_rows)
+            db_connection.commit()
+            if debug:
+                print(f"Stored {len(latest_rows)} position(s), {len(history_rows)} history row(s)")
+
+    except sqlite3.Error as e:
+        print(f"SQLite error in flush_positions: {e}")
+    finally:
+        db_connection.close()
+
+def flush_positions_periodically() -> None:
+    """Function to batch-write positions in a separate thread."""
+    while True:
+        time.sleep(position_flush_interval)
+        flush_positions()
+
+# Telemetry recording
+pending_telemetry = []  # (node_num, time, battery_level, voltage, channel_utilization, air_util_tx)
+pending_telemetry_lock = threading.Lock()
+telemetry_rollups = {"1m": 60, "1h": 3600, "1d": 86400}  # rollup table suffix -> bucket width in seconds
+# Each metric keeps its own sample count, since devices leave out the ones they do not measure
+telemetry_metric_counts = ("battery_samples", "voltage_samples", "channel_utilization_samples", "air_util_tx_samples")
+telemetry_rollup_columns = ("node_num, bucket, samples, battery_samples, battery_sum, battery_min, voltage_samples, voltage_sum, "
+                            "channel_utilization_samples, channel_utilization_sum, channel_utilization_max, "
+                            "air_util_tx_samples, air_util_tx_sum, air_util_tx_max")
+# Two-argument MIN/MAX return NULL if either side is NULL, so an empty side falls back to the other
+telemetry_rollup_upsert = ("ON CONFLICT (node_num, bucket) DO UPDATE SET samples = samples + excluded.samples, "
+                           "battery_samples = battery_samples + excluded.battery_samples, battery_sum = battery_sum + excluded.battery_sum, "
+                           "battery_min = COALESCE(MIN(battery_min, excluded.battery_min), battery_min, excluded.battery_min), "
+                           "voltage_samples = voltage_samples + excluded.voltage_samples, voltage_sum = voltage_sum + excluded.voltage_sum, "
+                           "channel_utilization_samples = channel_utilization_samples + excluded.channel_utilization_samples, "
+                           "channel_utilization_sum = channel_utilization_sum + excluded.channel_utilization_sum, "
+                           "channel_utilization_max = COALESCE(MAX(channel_utilization_max, excluded.channel_utilization_max), channel_utilization_max, excluded.channel_utilization_max), "
+                           "air_util_tx_samples = air_util_tx_samples + excluded.air_util_tx_samples, "
+                           "air_util_tx_sum = air_util_tx_sum + excluded.air_util_tx_sum, "
+                           "air_util_tx_max = COALESCE(MAX(air_util_tx_max, excluded.air_util_tx_max), air_util_tx_max, excluded.air_util_tx_max)")
+
+def queue_telemetry(node_id, metrics):
+    """Hold a device metrics sample until the next batch write. Metrics the device did not send are stored as NULL."""
+    def optional(field):
+        return getattr(metrics, field) if metrics.HasField(field) else None
+
+    with pending_telemetry_lock:
+        pending_telemetry.append((node_id, int(time.time()), optional("battery_level"), optional("voltage"),
+                                  optional("channel_utilization"), optional("air_util_tx")))
+
+def flush_telemetry():
+    """Append raw telemetry and fold it into the rollup tables in one transaction."""
+    global pending_telemetry
+    with pending_telemetry_lock:
+        if not pending_telemetry:
+            return
+        batch = pending_telemetry
+        pending_telemetry = []
+
+    table_name = table_prefix + "_telemetry"
+
+    try:
+        with sqlite3.connect(db_file_path) as db_connection:
+            db_cursor = db_connection.cursor()
+            # Only samples that made it into the raw table are rolled up; a repeat of (node, second) is ignored in both
+            inserted = []
+            for sample in batch:
+                db_cursor.execute(f'''
+                    INSERT OR IGNORE INTO {table_name} (node_num, time, battery_level, voltage, channel_utilization, air_util_tx)
+                    VALUES (?,?,?,?,?,?)
+                ''', sample)
+                if db_cursor.rowcount == 1:
+                    inserted.append(sample)
+
+            for suffix, width in telemetry_rollups.items():
+                # Aggregate the batch per (node, bucket) first so each rollup row is touched once
+                buckets = {}
+                for node_id, sample_time, battery, voltage, channel_util, air_util in inserted:
+                    bucket_key = (node_id, sample_time - sample_time % width)
+                    agg = buckets.get(bucket_key)
+                    if agg is None:
+                        # Laid out like telemetry_rollup_columns after the key; absent metrics add nothing
+                        agg = buckets[bucket_key] = [0, 0, 0, None, 0, 0.0, 0, 0.0, None, 0, 0.0, None]
+                    agg[0] += 1
+                    if battery is not None:
+                        agg[1] += 1
+                        agg[2] += battery
+                        agg[3] = battery if agg[3] is None else min(agg[3], battery)
+                    if voltage is not None:
+                        agg[4] += 1
+                        agg[5] += voltage
+                    if channel_util is not None:
+                        agg[6] += 1
+                        agg[7] += channel_util
+                        agg[8] = channel_util if agg[8] is None else max(agg[8], channel_util)
+                    if air_util is not None:
+                        agg[9] += 1
+                        agg[10] += air_util
+                        agg[11] = air_util if agg[11] is None else max(agg[11], air_util)
+
+                db_cursor.executemany(f'''
+                    INSERT INTO {table_name}_{suffix} ({telemetry_rollup_columns})
+                    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                    {telemetry_rollup_upsert}
+                ''', [bucket_key + tuple(agg) for bucket_key, agg in buckets.items()])
+
+            db_connection.commit()
+            if debug:
+                print(f"Stored {len(inserted)} telemetry sample(s), ignored {len(batch) - len(inserted)} duplicate(s)")
+
+    except sqlite3.Error as e:
+        print(f"SQLite error in flush_telemetry: {e}")
+    finally:
+        db_connection.close()
+
+def expire_telemetry():
+    """Delete raw samples and minute rollups past their retention."""
+    table_name = table_prefix + "_telemetry"
+    now = int(time.time())
+
+    try:
+        with sqlite3.connect(db_file_path) as db_connection:
+            db_cursor = db_connection.cursor()
+            db_cursor.execute(f'DELETE FROM {table_name} WHERE time < ?', (now - telemetry_raw_retention_days * 86400,))
+            db_cursor.execute(f'DELETE FROM {table_name}_1m WHERE bucket < ?', (now - telemetry_minute_retention_days * 86400,))
+            db_connection.commit()
+
+    except sqlite3.Error as e:
+        print(f"SQLite error in expire_telemetry: {e}")
+    finally:
+        db_connection.close()
+
+def flush_telemetry_periodically() -> None:
+    """Function to batch-write telemetry and expire old samples in a separate thread."""
+    last_expiry = 0.0
+    while True:
+        time.sleep(telemetry_flush_interval)
+        flush_telemetry()
+        if time.time() - last_expiry >= 3600:
+            expire_telemetry()
+            last_expiry = time.time()
+
+# Usage statistics
+pending_usage = {}  # (hour, region, node number) -> [dms, fortunes] counted since the last flush
+pending_usage_lock = threading.Lock()
+usage_columns = {"dms": 0, "fortunes": 1}
+
+def count_usage(node_id, column):
+    """Count a DM received or a fortune sent in the current hour for the sender's region."""
+    now = int(time.time())
+    key = (now - now % 3600, node_registry.region_of(node_id) or "", node_id)
+    with pending_usage_lock:
+        counts = pending_usage.get(key)
+        if counts is None:
+            counts = pending_usage[key] = [0, 0]
+        counts[usage_columns[column]] += 1
+
+def flush_usage():
+    """Add the counts gathered since the last flush to the hourly usage rollup."""
+    global pending_usage
+    with pending_usage_lock:
+        if not pending_usage:
+            return
+        batch = pending_usage
+        pending_usage = {}
+
+    table_name = table_prefix + "_usage_1h"
+    try:
+        with sqlite3.connect(db_file_path) as db_connection:
+            db_connection.executemany(f'''
+                INSERT INTO {table_name} (hour, region, node_num, dms, fortunes) VALUES (?,?,?,?,?)
+                ON CONFLICT (hour, region, node_num) DO UPDATE SET
+                    dms = dms + excluded.dms,
+                    fortunes = fortunes + excluded.fortunes
+            ''', [key + tuple(counts) for key, counts in batch.items()])
+            db_connection.commit()
+            if debug:
+                print(f"Stored {len(batch)} usage counter(s)")
+    except sqlite3.Error as e:
+        print(f"SQLite error in flush_usage: {e}")
+    finally:
+        db_connection.close()
+
+def flush_usage_periodically() -> None:
+    """Function to batch-write usage counters in a separate thread."""
+    while True:
+        time.sleep(usage_flush_interval)
+        flush_usage()
+
 def message_exists(mp) -> bool:
     """Check for message id in db, ignore duplicates."""
     if debug:
         print("message_exists")
     try:
-        table_name = sanitize_string(mqtt_broker) + "_" + sanitize_string(root_topic) + sanitize_string(channel) + "_messages"
+        table_name = table_prefix + "_messages"
 
         with sqlite3.connect(db_file_path) as db_connection:
             db_cursor = db_connection.cursor()
@@ -560,18 +1328,25 @@ def send_node_info(destination_id, want_response):
 
         generate_mesh_packet(destination_id, encoded_message)
 
-def generate_mesh_packet(destination_id, encoded_message):
-    """Send a packet out over the mesh."""
+def generate_mesh_packet(destination_id, encoded_message, packet_id=None):
+    """Send a packet out over the mesh. Pass packet_id to retransmit an earlier packet."""
     global global_message_id
+    # Read every setting from one snapshot so a concurrent reload cannot mix identities or keys in one packet
+    config = current_config
+    node_number, node_name, channel, key, root_topics = (config["node_number"], config["node_name"], config["channel"],
+                                                         config["key"], config["root_topics"])
     mesh_packet = mesh_pb2.MeshPacket()
 
-    mesh_packet.id = global_message_id
-    global_message_id += 1
+    if packet_id is None:
+        mesh_packet.id = global_message_id
+        global_message_id += 1
+    else:
+        mesh_packet.id = packet_id
 
     setattr(mesh_packet, "from", node_number)
     mesh_packet.to = destination_id
     mesh_packet.want_ack = True
-    mesh_packet.channel = generate_hash(channel, key)
+    mesh_packet.channel = config["channel_hash"]
     
     if destination_id != BROADCAST_NUM:
         mesh_packet.hop_limit = 3
@@ -588,7 +1363,7 @@ def generate_mesh_packet(destination_id, encoded_message):
         if debug:
             print("key is none")
     else:
-        mesh_packet.encrypted = encrypt_message(channel, key, mesh_packet, encoded_message)
+        mesh_packet.encrypted = encrypt_message(mesh_packet, encoded_message, config)
         if debug:
             print("key present")
 
@@ -598,7 +1373,6 @@ def generate_mesh_packet(destination_id, encoded_message):
     service_envelope.gateway_id = node_name
 
     payload = service_envelope.SerializeToString()
-    set_topic()
     
     # For broadcast messages, publish to ALL topics
     if destination_id == BROADCAST_NUM:
@@ -611,17 +1385,19 @@ def generate_mesh_packet(destination_id, encoded_message):
             if debug:
                 print(f"Publishing to topic {i+1}/{len(root_topics)}: {broadcast_topic}")
             
-            result = client.publish(broadcast_topic, payload)
+            result = publish_packet(broadcast_topic, payload)
             
             if debug:
-                print(f"MQTT publish result for {broadcast_topic}: {result.rc}")
-                if result.rc == 0:
+                print(f"MQTT publish result for {broadcast_topic}: {result}")
+                if result == 0:
                     print(f"MQTT publish successful to {broadcast_topic}")
                 else:
-                    print(f"MQTT publish failed to {broadcast_topic} with code: {result.rc}")
+                    print(f"MQTT publish failed to {broadcast_topic} with code: {result}")
     else:
         # For direct messages, try to send to recipient's last known region from our node
-        recipient_topic = get_node_topic_for_direct_message(destination_id)
+        recipient_topic = get_node_topic_for_direct_message(destination_id, config)
+        region = recipient_topic.rsplit(channel + "/", 1)[0] if recipient_topic else "*"
+        published = False
         
         if recipient_topic:
             # Send from our node in the specific region where recipient was last seen
@@ -629,14 +1405,15 @@ def generate_mesh_packet(destination_id, encoded_message):
                 print(f"Sending direct message from our node in recipient's region: {recipient_topic}")
                 print(f"Payload size: {len(payload)} bytes")
             
-            result = client.publish(recipient_topic, payload)
+            result = publish_packet(recipient_topic, payload)
+            published = result == mqtt.MQTT_ERR_SUCCESS
             
             if debug:
-                print(f"MQTT publish result for {recipient_topic}: {result.rc}")
-                if result.rc == 0:
+                print(f"MQTT publish result for {recipient_topic}: {result}")
+                if result == 0:
                     print(f"Direct message published successfully to {recipient_topic}")
                 else:
-                    print(f"Direct message failed to {recipient_topic} with code: {result.rc}")
+                    print(f"Direct message failed to {recipient_topic} with code: {result}")
         else:
             # Fallback: broadcast from our node to all regions
             if debug:
@@ -649,39 +1426,141 @@ def generate_mesh_packet(destination_id, encoded_message):
                 if debug:
                     print(f"Publishing direct message from our node to topic {i+1}/{len(root_topics)}: {broadcast_topic}")
                 
-                result = client.publish(broadcast_topic, payload)
+                result = publish_packet(broadcast_topic, payload)
+                published = published or result == mqtt.MQTT_ERR_SUCCESS
                 
                 if debug:
-                    print(f"MQTT publish result for {broadcast_topic}: {result.rc}")
-                    if result.rc == 0:
+                    print(f"MQTT publish result for {broadcast_topic}: {result}")
+                    if result == 0:
                         print(f"Direct message published successfully to {broadcast_topic}")
                     else:
-                        print(f"Direct message failed to {broadcast_topic} with code: {result.rc}")
+                        print(f"Direct message failed to {broadcast_topic} with code: {result}")
                 
                 if i < len(root_topics) - 1:
                     time.sleep(0.1)
 
-def encrypt_message(channel, key, mesh_packet, encoded_message):
+        # Packets that only reached the outbox never left the host, so there is nothing to wait for yet.
+        # Only fortunes sent to a known region are retried; a retry of the all-regions fallback would
+        # multiply every publish by the number of root topics.
+        if packet_id is None and published and recipient_topic and encoded_message.portnum in ack_tracked_portnums:
+            track_pending_ack(mesh_packet.id, destination_id, encoded_message, region)
+
+def encrypt_message(mesh_packet, encoded_message, config=None):
     """Encrypt a message."""
     if debug:
         print("encrypt_message")
 
-    if key == "AQ==":
-        key = "1PG7OiApB1nwvP+rz05pAQ=="
-
-    mesh_packet.channel = generate_hash(channel, key)
-    key_bytes = base64.b64decode(key.encode('ascii'))
+    config = config or current_config
+    mesh_packet.channel = config["channel_hash"]
 
     nonce_packet_id = mesh_packet.id.to_bytes(8, "little")
-    nonce_from_node = node_number.to_bytes(8, "little")
+    nonce_from_node = config["node_number"].to_bytes(8, "little")
     nonce = nonce_packet_id + nonce_from_node
 
-    cipher = Cipher(algorithms.AES(key_bytes), modes.CTR(nonce), backend=default_backend())
+    cipher = aes_ctr_cipher(nonce, config["key_bytes"])
     encryptor = cipher.encryptor()
     encrypted_bytes = encryptor.update(encoded_message.SerializeToString()) + encryptor.finalize()
 
     return encrypted_bytes
 
+# Delivery tracking
+ack_tracked_portnums = frozenset((portnums_pb2.TEXT_MESSAGE_APP, portnums_pb2.TEXT_MESSAGE_COMPRESSED_APP))  # fortune text only
+pending_acks = {}  # packet id -> [destination_id, encoded_message, attempts, region, wheel slot]
+ack_lock = threading.Lock()
+delivery_stats = {}  # region -> {"sent", "delivered", "retries", "failed"}
+
+def count_delivery(region, counter):
+    """Bump a per-region delivery counter. Caller holds ack_lock."""
+    stats = delivery_stats.setdefault(region, {"sent": 0, "delivered": 0, "retries": 0, "failed": 0})
+    stats[counter] += 1
+
+def schedule_ack_timeout(packet_id, entry):
+    """Place a pending packet on the timer wheel according to its retry count. Caller holds ack_lock."""
+    ticks = int(ack_timeout * (2 ** entry[2]) / ack_wheel_tick)
+    ticks = max(1, min(ticks, len(ack_wheel) - 1))
+    slot = (ack_wheel_position + ticks) % len(ack_wheel)
+    entry[4] = slot
+    ack_wheel[slot].add(packet_id)
+
+def track_pending_ack(packet_id, destination_id, encoded_message, region):
+    """Remember a direct packet until the recipient's routing ACK comes back."""
+    with ack_lock:
+        if len(pending_acks) >= max_pending_acks:
+            # Give up on the oldest packet to keep the table bounded
+            oldest_id = next(iter(pending_acks))
+            oldest = pending_acks.pop(oldest_id)
+            ack_wheel[oldest[4]].discard(oldest_id)
+            count_delivery(oldest[3], "failed")
+
+        entry = [destination_id, encoded_message, 0, region, 0]
+        pending_acks[packet_id] = entry
+        schedule_ack_timeout(packet_id, entry)
+        count_delivery(region, "sent")
+
+def handle_routing_ack(request_id, error_reason):
+    """Resolve a pending packet from an incoming ROUTING_APP response."""
+    with ack_lock:
+        entry = pending_acks.get(request_id)
+        if entry is None:
+            return
+        if error_reason != mesh_pb2.Routing.NONE:
+            # Leave it on the wheel so it gets retransmitted
+            if debug:
+                print(f"Packet {request_id} was NAKed with reason {error_reason}")
+            return
+
+        del pending_acks[request_id]
+        ack_wheel[entry[4]].discard(request_id)
+        count_delivery(entry[3], "delivered")
+
+    if debug:
+        print(f"Packet {request_id} delivered to {entry[0]}")
+
+def get_delivery_stats() -> dict:
+    """Return per-region delivery counters and the delivery rate."""
+    with ack_lock:
+        report = {}
+        for region, stats in delivery_stats.items():
+            report[region] = dict(stats)
+            report[region]["delivery_rate"] = stats["delivered"] / stats["sent"] if stats["sent"] else None
+        return report
+
+def ack_timer():
+    """Function to advance the ACK timer wheel in a separate thread."""
+    global ack_wheel_position
+    while True:
+        time.sleep(ack_wheel_tick)
+
+        retransmits = []
+        with ack_lock:
+            ack_wheel_position = (ack_wheel_position + 1) % len(ack_wheel)
+            expired = ack_wheel[ack_wheel_position]
+            ack_wheel[ack_wheel_position] = set()
+
+            for packet_id in expired:
+                entry = pending_acks.get(packet_id)
+                if entry is None:
+                    continue
+                if not mqtt_connected.is_set():
+                    # A retransmit now would only fill the outbox; try again once the broker is back
+                    schedule_ack_timeout(packet_id, entry)
+                    continue
+                if entry[2] >= max_retransmits:
+                    del pending_acks[packet_id]
+                    count_delivery(entry[3], "failed")
+                    if debug:
+                        print(f"Giving up on packet {packet_id} to {entry[0]} after {entry[2]} retries")
+                    continue
+                entry[2] += 1
+                count_delivery(entry[3], "retries")
+                schedule_ack_timeout(packet_id, entry)
+                retransmits.append((packet_id, entry[0], entry[1]))
+
+        for packet_id, destination_id, encoded_message in retransmits:
+            if debug:
+                print(f"Retransmitting packet {packet_id} to {destination_id}")
+            generate_mesh_packet(destination_id, encoded_message, packet_id=packet_id)
+
 def send_ack(destination_id, message_id):
     """Return a meshtastic acknowledgement."""
     if debug:
@@ -697,20 +1576,77 @@ def send_ack(destination_id, message_id):
 def setup_db():
     """Setup database tables."""
     try:
-        table_name = sanitize_string(mqtt_broker) + "_" + sanitize_string(root_topic) + sanitize_string(channel) + "_messages"
-        nodeinfo_table_name = sanitize_string(mqtt_broker) + "_" + sanitize_string(root_topic) + sanitize_string(channel) + "_nodeinfo"
+        table_name = table_prefix + "_messages"
+        nodeinfo_table_name = table_prefix + "_nodeinfo"
+        outbox_table_name = table_prefix + "_outbox"
+        positions_table_name = table_prefix + "_positions"
+        position_history_table_name = table_prefix + "_position_history"
+        telemetry_table_name = table_prefix + "_telemetry"
+        routing_table_name = table_prefix + "_routing"
+        usage_table_name = table_prefix + "_usage_1h"
         
         with sqlite3.connect(db_file_path) as db_connection:
             db_cursor = db_connection.cursor()
             
+            # WAL lets readers (exports, dashboards) snapshot the db without blocking our writes
+            db_cursor.execute('PRAGMA journal_mode=WAL')
+            
             # Create messages table
             db_cursor.execute(f'''CREATE TABLE IF NOT EXISTS {table_name}
-                                (time TEXT, sender_short_name TEXT, text_payload TEXT, message_id TEXT, is_encrypted INTEGER)''')
+                                (time TEXT, sender_short_name TEXT, text_payload TEXT, message_id TEXT, is_encrypted INTEGER, region TEXT)''')
+            # Per-region queries and retention only walk their own slice of this index
+            db_cursor.execute(f'CREATE INDEX IF NOT EXISTS {table_name}_region_time ON {table_name} (region, time)')
+            db_cursor.execute(f'CREATE INDEX IF NOT EXISTS {table_name}_message_id ON {table_name} (message_id)')
             
             # Create nodeinfo table
             db_cursor.execute(f'''CREATE TABLE IF NOT EXISTS {nodeinfo_table_name}
                                 (user_id TEXT PRIMARY KEY, long_name TEXT, short_name TEXT, hw_model INTEGER)''')
             
+            # Create positions tables, indexed by geohash prefix and time
+            db_cursor.execute(f'''CREATE TABLE IF NOT EXISTS {positions_table_name}
+                                (node_num INTEGER PRIMARY KEY, user_id TEXT, short_name TEXT, latitude REAL, longitude REAL,
+                                 altitude INTEGER, geohash TEXT, time INTEGER, region TEXT)''')
+            db_cursor.execute(f'CREATE INDEX IF NOT EXISTS {positions_table_name}_geohash ON {positions_table_name} (geohash)')
+            db_cursor.execute(f'CREATE INDEX IF NOT EXISTS {positions_table_name}_time ON {positions_table_name} (time)')
+            db_cursor.execute(f'CREATE INDEX IF NOT EXISTS {positions_table_name}_region_geohash ON {positions_table_name} (region, geohash)')
+            db_cursor.execute(f'''CREATE TABLE IF NOT EXISTS {position_history_table_name}
+                                (node_num INTEGER, time INTEGER, latitude REAL, longitude REAL, altitude INTEGER, geohash TEXT)''')
+            db_cursor.execute(f'CREATE INDEX IF NOT EXISTS {position_history_table_name}_geohash_time ON {position_history_table_name} (geohash, time)')
+            db_cursor.execute(f'CREATE INDEX IF NOT EXISTS {position_history_table_name}_node_time ON {position_history_table_name} (node_num, time)')
+            
+            # Create routing table: region each node was last seen in
+            db_cursor.execute(f'''CREATE TABLE IF NOT EXISTS {routing_table_name}
+                                (node_num INTEGER PRIMARY KEY, region TEXT, last_seen INTEGER)''')
+            db_cursor.execute(f'CREATE INDEX IF NOT EXISTS {routing_table_name}_last_seen ON {routing_table_name} (last_seen, node_num)')
+            db_cursor.execute(f'CREATE INDEX IF NOT EXISTS {routing_table_name}_region ON {routing_table_name} (region, last_seen)')
+            
+            # Create telemetry tables: compact raw samples plus incremental rollups
+            db_cursor.execute(f'''CREATE TABLE IF NOT EXISTS {telemetry_table_name}
+                                (node_num INTEGER, time INTEGER, battery_level INTEGER, voltage REAL,
+                                 channel_utilization REAL, air_util_tx REAL, PRIMARY KEY (node_num, time)) WITHOUT ROWID''')
+            db_cursor.execute(f'CREATE INDEX IF NOT EXISTS {telemetry_table_name}_time ON {telemetry_table_name} (time)')
+            for suffix in telemetry_rollups:
+                db_cursor.execute(f'''CREATE TABLE IF NOT EXISTS {telemetry_table_name}_{suffix}
+                                    (node_num INTEGER, bucket INTEGER, samples INTEGER, battery_samples INTEGER, battery_sum INTEGER,
+                                     battery_min INTEGER, voltage_samples INTEGER, voltage_sum REAL, channel_utilization_samples INTEGER,
+                                     channel_utilization_sum REAL, channel_utilization_max REAL, air_util_tx_samples INTEGER,
+                                     air_util_tx_sum REAL, air_util_tx_max REAL, PRIMARY KEY (node_num, bucket)) WITHOUT ROWID''')
+                rollup_columns = {row[1] for row in db_cursor.execute(f'PRAGMA table_info({telemetry_table_name}_{suffix})')}
+                for count_column in telemetry_metric_counts:
+                    if count_column not in rollup_columns:
+                        # Older rollups counted every metric in every sample
+                        db_cursor.execute(f'ALTER TABLE {telemetry_table_name}_{suffix} ADD COLUMN {count_column} INTEGER')
+                        db_cursor.execute(f'UPDATE {telemetry_table_name}_{suffix} SET {count_column} = samples')
+            
+            # Create hourly usage rollup: DMs received and fortunes sent per region and sender
+            db_cursor.execute(f'''CREATE TABLE IF NOT EXISTS {usage_table_name}
+                                (hour INTEGER, region TEXT, node_num INTEGER, dms INTEGER, fortunes INTEGER,
+                                 PRIMARY KEY (hour, region, node_num)) WITHOUT ROWID''')
+            
+            # Create outbox table for packets buffered while disconnected
+            db_cursor.execute(f'''CREATE TABLE IF NOT EXISTS {outbox_table_name}
+                                (id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT, payload BLOB)''')
+            
             db_connection.commit()
             if debug:
                 print("Database tables created/verified")
@@ -720,12 +1656,131 @@ def setup_db():
     finally:
         db_connection.close()
 
+# Storage maintenance
+# (table suffix, columns, legacy select expressions, chunk key, conflict clause) in migration order
+legacy_migrations = [
+    ("routing", "node_num, region, last_seen", "node_num, region, last_seen", "rowid",
+     "ON CONFLICT (node_num) DO UPDATE SET region = excluded.region, last_seen = excluded.last_seen WHERE excluded.last_seen > last_seen"),
+    ("nodeinfo", "user_id, long_name, short_name, hw_model", "user_id, long_name, short_name, hw_model", "rowid", "ON CONFLICT DO NOTHING"),
+    ("outbox", "topic, payload", "topic, payload", "rowid", ""),
+    # The old tables never recorded where a message was heard
+    ("messages", "time, sender_short_name, text_payload, message_id, is_encrypted, region",
+     "time, sender_short_name, text_payload, message_id, is_encrypted, NULL", "rowid", ""),
+    # Positions written since the upgrade are newer than anything in the old tables
+    ("positions", "node_num, user_id, short_name, latitude, longitude, altitude, geohash, time, region",
+     "node_num, user_id, short_name, latitude, longitude, altitude, geohash, time, "
+     "(SELECT region FROM {prefix}_routing AS routing WHERE routing.node_num = legacy.node_num)", "rowid", "ON CONFLICT DO NOTHING"),
+    ("position_history", "node_num, time, latitude, longitude, altitude, geohash", "node_num, time, latitude, longitude, altitude, geohash", "rowid", ""),
+    ("telemetry", "node_num, time, battery_level, voltage, channel_utilization, air_util_tx",
+     "node_num, time, battery_level, voltage, channel_utilization, air_util_tx", "node_num, time", "ON CONFLICT DO NOTHING"),
+] + [
+    # The old rollups have no per-metric counts; every metric was counted in every sample
+    ("telemetry_" + suffix, telemetry_rollup_columns,
+     "node_num, bucket, samples, samples, battery_sum, battery_min, samples, voltage_sum, samples, channel_utilization_sum, "
+     "channel_utilization_max, samples, air_util_tx_sum, air_util_tx_max", "node_num, bucket", telemetry_rollup_upsert)
+    for suffix in telemetry_rollups
+] + [
+    ("usage_1h", "hour, region, node_num, dms, fortunes", "hour, region, node_num, dms, fortunes", "hour, region, node_num",
+     "ON CONFLICT (hour, region, node_num) DO UPDATE SET dms = dms + excluded.dms, fortunes = fortunes + excluded.fortunes"),
+]
+
+def migrate_legacy_chunk(legacy_table, table_name, columns, select, key, conflict):
+    """Move one chunk of a legacy table into the shared table, dropping the legacy table once it is empty.
+    Returns rows moved, or None on error."""
+    # Re-selecting the same chunk for the delete is safe: nothing else writes to legacy tables
+    chunk = f'({key}) IN (SELECT {key} FROM {legacy_table} ORDER BY {key} LIMIT {max(1, migration_chunk_size)})'
+    try:
+        with sqlite3.connect(db_file_path) as db_connection:
+            db_cursor = db_connection.cursor()
+            db_cursor.execute(f'INSERT INTO {table_name} ({columns}) SELECT {select.format(prefix=table_prefix)} FROM {legacy_table} AS legacy WHERE {chunk} {conflict}')
+            moved = db_cursor.execute(f'DELETE FROM {legacy_table} WHERE {chunk}').rowcount
+            if moved == 0:
+                db_cursor.execute(f'DROP TABLE {legacy_table}')
+            db_connection.commit()
+            return moved
+
+    except sqlite3.Error as e:
+        print(f"SQLite error in migrate_legacy_chunk ({legacy_table}): {e}")
+        return None
+    finally:
+        db_connection.close()
+
+def migrate_legacy_tables(suffixes=None):
+    """One-shot move of the old tables named after the first root topic into the shared region-tagged tables."""
+    try:
+        with sqlite3.connect(db_file_path) as db_connection:
+            existing = {name for (name,) in db_connection.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    except sqlite3.Error as e:
+        print(f"SQLite error in migrate_legacy_tables: {e}")
+        return
+    finally:
+        db_connection.close()
+
+    total = 0
+    for legacy_prefix in legacy_table_prefixes:
+        for suffix, columns, select, key, conflict in legacy_migrations:
+            legacy_table = legacy_prefix + "_" + suffix
+            if legacy_table not in existing or (suffixes is not None and suffix not in suffixes):
+                continue
+            while True:
+                moved = migrate_legacy_chunk(legacy_table, table_prefix + "_" + suffix, columns, select, key, conflict)
+                if not moved:
+                    break
+                total += moved
+                # Let the bot's own writers in between chunks
+                time.sleep(0.05)
+
+    if total:
+        update_console(f"{format_time(current_time())} >>> Migrated {total} row(s) from per-topic tables", tag="info")
+
+def expire_messages():
+    """Delete messages older than their region's retention, one region slice of the (region, time) index at a time."""
+    now = int(time.time())
+    table_name = table_prefix + "_messages"
+    deleted = 0
+    try:
+        with sqlite3.connect(db_file_path) as db_connection:
+            db_cursor = db_connection.cursor()
+            for region in set(root_topics) | set(region_retention):
+                days = region_retention.get(region, message_retention_days)
+                if days > 0:
+                    # time is stored as text; epoch seconds compare correctly as equal-length strings
+                    deleted += db_cursor.execute(f'DELETE FROM {table_name} WHERE region=? AND time < ?',
+                                                 (region, str(now - days * 86400))).rowcount
+            if message_retention_days > 0:
+                # Messages migrated from the old tables have no region
+                deleted += db_cursor.execute(f'DELETE FROM {table_name} WHERE region IS NULL AND time < ?',
+                                             (str(now - message_retention_days * 86400),)).rowcount
+            db_connection.commit()
+            if debug and deleted:
+                print(f"Expired {deleted} message(s)")
+
+    except sqlite3.Error as e:
+        print(f"SQLite error in expire_messages: {e}")
+    finally:
+        db_connection.close()
+
+def storage_maintenance() -> None:
+    """Function to finish the legacy table migration and then expire old messages hourly in a separate thread."""
+    migrate_legacy_tables()
+    while True:
+        expire_messages()
+        time.sleep(3600)
+
 def maybe_store_nodeinfo_in_db(info):
     """Save nodeinfo in sqlite unless that record is already there."""
     if debug:
         print("node info packet received: Checking for existing entry in DB")
 
-    table_name = sanitize_string(mqtt_broker) + "_" + sanitize_string(root_topic) + sanitize_string(channel) + "_nodeinfo"
+    table_name = table_prefix + "_nodeinfo"
+
+    if info.id.startswith('!'):
+        try:
+            info_node_num = int(info.id[1:], 16)
+            node_registry.update(info_node_num, short_name=info.short_name, long_name=info.long_name, hw_model=info.hw_model)
+            forget_node_info_request(info_node_num)
+        except ValueError:
+            pass
 
     try:
         with sqlite3.connect(db_file_path) as db_connection:
@@ -769,19 +1824,19 @@ def maybe_store_nodeinfo_in_db(info):
     finally:
         db_connection.close()
 
-def insert_message_to_db(time, sender_short_name, text_payload, message_id, is_encrypted):
+def insert_message_to_db(time, sender_short_name, text_payload, message_id, is_encrypted, region=None):
     """Save a meshtastic message to sqlite storage."""
     if debug:
         print("insert_message_to_db")
 
-    table_name = sanitize_string(mqtt_broker) + "_" + sanitize_string(root_topic) + sanitize_string(channel) + "_messages"
+    table_name = table_prefix + "_messages"
 
     try:
         with sqlite3.connect(db_file_path) as db_connection:
             db_cursor = db_connection.cursor()
             formatted_message = text_payload.strip()
-            db_cursor.execute(f'INSERT INTO {table_name} (time, sender_short_name, text_payload, message_id, is_encrypted) VALUES (?,?,?,?,?)',
-                              (time, sender_short_name, formatted_message, message_id, is_encrypted))
+            db_cursor.execute(f'INSERT INTO {table_name} (time, sender_short_name, text_payload, message_id, is_encrypted, region) VALUES (?,?,?,?,?,?)',
+                              (time, sender_short_name, formatted_message, message_id, is_encrypted, region))
             db_connection.commit()
 
     except sqlite3.Error as e:
@@ -789,29 +1844,146 @@ def insert_message_to_db(time, sender_short_name, text_payload, message_id, is_e
     finally:
         db_connection.close()
 
+def publish_packet(topic, payload):
+    """Publish a payload, buffering it in the outbox if the broker is unreachable."""
+    with outbox_lock:
+        # Keep ordering: anything still waiting in the outbox goes first
+        if client.is_connected() and not outbox:
+            result = client.publish(topic, payload)
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                return result.rc
+        buffer_packet(topic, payload)
+
+    return mqtt.MQTT_ERR_NO_CONN
+
+def buffer_packet(topic, payload):
+    """Queue an outbound packet until the connection comes back. Caller holds outbox_lock."""
+    row_id = None
+    table_name = table_prefix + "_outbox"
+
+    if len(outbox) == outbox.maxlen:
+        dropped = outbox.popleft()
+        if debug:
+            print("Outbox full, dropping oldest buffered packet")
+        if persist_outbox:
+            delete_outbox_rows([dropped[0]])
+
+    if persist_outbox:
+        try:
+            with sqlite3.connect(db_file_path) as db_connection:
+                db_cursor = db_connection.cursor()
+                db_cursor.execute(f'INSERT INTO {table_name} (topic, payload) VALUES (?,?)', (topic, payload))
+                row_id = db_cursor.lastrowid
+                db_connection.commit()
+        except sqlite3.Error as e:
+            print(f"SQLite error in buffer_packet: {e}")
+        finally:
+            db_connection.close()
+
+    outbox.append((row_id, topic, payload))
+    if debug:
+        print(f"Buffered packet for {topic} ({len(outbox)} waiting)")
+
+def delete_outbox_rows(row_ids):
+    """Remove sent or dropped packets from the persisted outbox."""
+    row_ids = [(row_id,) for row_id in row_ids if row_id is not None]
+    if not row_ids:
+        return
+
+    table_name = table_prefix + "_outbox"
+    try:
+        with sqlite3.connect(db_file_path) as db_connection:
+            db_connection.executemany(f'DELETE FROM {table_name} WHERE id=?', row_ids)
+            db_connection.commit()
+    except sqlite3.Error as e:
+        print(f"SQLite error in delete_outbox_rows: {e}")
+    finally:
+        db_connection.close()
+
+def load_outbox_from_db():
+    """Reload packets that were still buffered when the bot last stopped."""
+    if not persist_outbox:
+        return
+
+    table_name = table_prefix + "_outbox"
+    try:
+        with sqlite3.connect(db_file_path) as db_connection:
+            rows = db_connection.execute(f'SELECT id, topic, payload FROM {table_name} ORDER BY id DESC LIMIT ?', (outbox_size,)).fetchall()
+            with outbox_lock:
+                outbox.clear()
+                outbox.extend(reversed(rows))
+            if debug and rows:
+                print(f"Loaded {len(rows)} buffered packet(s) from db")
+    except sqlite3.Error as e:
+        print(f"SQLite error in load_outbox_from_db: {e}")
+    finally:
+        db_connection.close()
+
+def flush_outbox():
+    """Publish buffered packets in the order they were queued."""
+    sent_ids = []
+    with outbox_lock:
+        while outbox:
+            row_id, topic, payload = outbox[0]
+            if client.publish(topic, payload).rc != mqtt.MQTT_ERR_SUCCESS:
+                break
+            outbox.popleft()
+            sent_ids.append(row_id)
+
+        if persist_outbox:
+            delete_outbox_rows(sent_ids)
+
+    if sent_ids:
+        update_console(f"{format_time(current_time())} >>> Flushed {len(sent_ids)} buffered packet(s)", tag="info")
+
+def get_connection_stats() -> dict:
+    """Return reconnect counters for the connection supervisor."""
+    return {
+        "connected": client.is_connected(),
+        "reconnect_count": reconnect_count,
+        "last_time_to_recover": last_time_to_recover,
+        "outbox_depth": len(outbox),
+    }
+
+def reconnect_backoff(attempt: int) -> float:
+    """Exponential backoff with jitter for the given reconnect attempt."""
+    # Cap the exponent so long outages cannot overflow the float
+    delay = min(auto_reconnect_max_delay, auto_reconnect_delay * (2 ** min(attempt, 16)))
+    # Equal jitter keeps some spacing while spreading out reconnect storms
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def connection_supervisor():
+    """Function to reconnect to the MQTT server in a separate thread."""
+    while True:
+        reconnect_requested.wait()
+
+        attempt = 0
+        while not mqtt_connected.is_set():
+            try:
+                delay = reconnect_backoff(attempt)
+                update_console(f"{format_time(current_time())} >>> Reconnect attempt {attempt + 1} in {delay:.1f} second(s)", tag="info")
+                if mqtt_connected.wait(timeout=delay):
+                    break
+                connect_mqtt()
+                # Give the broker a moment to answer before backing off again
+                mqtt_connected.wait(timeout=min(auto_reconnect_max_delay, 10.0))
+            except Exception as e:
+                # Never let the supervisor die, or the bot stays offline for good
+                print(f"Error in connection supervisor: {str(e)}")
+                time.sleep(max(1.0, auto_reconnect_delay))
+            attempt += 1
+
+        reconnect_requested.clear()
+
 def connect_mqtt():
     """Connect to the MQTT server."""
     if debug:
         print("connect_mqtt")
-    global mqtt_broker, mqtt_port, mqtt_username, mqtt_password, root_topic, root_topics, channel, node_number, db_file_path, key
     if not client.is_connected():
         try:
-            if ':' in mqtt_broker:
-                mqtt_broker,mqtt_port = mqtt_broker.split(':')
-                mqtt_port = int(mqtt_port)
-
-            if key == "AQ==":
-                if debug:
-                    print("key is default, expanding to AES128")
-                key = "1PG7OiApB1nwvP+rz05pAQ=="
-
             if not move_text_up():
                 return
 
-            padded_key = key.ljust(len(key) + ((4 - (len(key) % 4)) % 4), '=')
-            replaced_key = padded_key.replace('-', '+').replace('_', '/')
-            key = replaced_key
-
             if debug:
                 print (f"padded & replaced key = {key}")
 
@@ -826,6 +1998,8 @@ def connect_mqtt():
 
         except Exception as e:
             update_console(f"{format_time(current_time())} >>> Failed to connect to MQTT broker: {str(e)}", tag="info")
+            if auto_reconnect is True:
+                reconnect_requested.set()
 
     else:
         update_console(f"{format_time(current_time())} >>> Already connected to {mqtt_broker}", tag="info")
@@ -842,9 +2016,103 @@ def disconnect_mqtt():
     else:
         update_console("Already disconnected", tag="info")
 
+# Settings whose threads or servers are only started at launch
+restart_settings = ("record_locations", "record_telemetry", "status_api_enabled", "status_api_host", "status_api_port")
+
+def reload_config():
+    """Re-read config.ini and apply only what changed, without dropping in-memory state."""
+    global outbox, fortune_corpus_mtime, fortune_line_cache
+    old_config = current_config
+    try:
+        new_config = parse_config(strict=True)
+    except Exception as e:
+        update_console(f"{format_time(current_time())} >>> Ignoring config reload, config.ini could not be parsed: {str(e)}", tag="info")
+        return
+
+    missing = old_config["config_options"] - new_config["config_options"]
+    if missing:
+        # Most likely an editor caught mid-save; removing options on purpose needs a restart
+        update_console(f"{format_time(current_time())} >>> Ignoring config reload, options missing: {', '.join(sorted(missing))}", tag="info")
+        return
+
+    if not is_valid_hex(new_config["node_name"], 8, 8):
+        update_console(f"{format_time(current_time())} >>> Ignoring config reload, invalid node name {new_config['node_name']}", tag="info")
+        return
+
+    changed = {name for name in new_config if new_config[name] != old_config.get(name)} - {"config_options"}
+    needs_restart = changed & set(restart_settings)
+    if needs_restart:
+        # Their threads are only started at launch, so keep the running values until then
+        update_console(f"{format_time(current_time())} >>> Restart to apply: {', '.join(sorted(needs_restart))}", tag="info")
+        new_config = MappingProxyType({**new_config, **{name: old_config[name] for name in needs_restart}})
+        changed -= needs_restart
+
+    if not changed:
+        if debug:
+            print("Config reload: no changes")
+        return
+
+    load_config(new_config)
+
+    if changed & {"compress_fortunes", "split_long_fortunes"}:
+        fortune_corpus_mtime = None  # Re-encode the corpus on next use
+        fortune_line_cache = {}
+    elif "keyword_fortunes" in changed:
+        fortune_corpus_mtime = None  # Rebuild the index from the cached encodings
+
+    if "outbox_size" in changed:
+        with outbox_lock:
+            outbox = deque(outbox, maxlen=outbox_size)
+
+    if "table_prefix" in changed:
+        setup_db()
+
+    if client.is_connected():
+        if changed & {"mqtt_broker", "mqtt_port", "mqtt_username", "mqtt_password", "node_number"}:
+            update_console(f"{format_time(current_time())} >>> Broker settings changed, reconnecting", tag="info")
+            client.disconnect()
+            connect_mqtt()
+        else:
+            # Only touch the topics that were added or removed
+            for topic in set(old_config["subscribe_topics"]) - set(subscribe_topics):
+                client.unsubscribe(topic)
+                if debug:
+                    print(f"Unsubscribed from: {topic}")
+            for topic in set(subscribe_topics) - set(old_config["subscribe_topics"]):
+                client.subscribe(topic)
+                if debug:
+                    print(f"Subscribed to: {topic}")
+
+            if changed & {"client_long_name", "client_short_name"}:
+                send_node_info(BROADCAST_NUM, want_response=False)
+
+    update_console(f"{format_time(current_time())} >>> Reloaded config.ini: {', '.join(sorted(changed))}", tag="info")
+
+def config_mtime():
+    """Return the modification time of config.ini, or None if it is missing."""
+    try:
+        return os.stat('config.ini').st_mtime
+    except OSError:
+        return None
+
+def config_watcher():
+    """Function to reload config.ini on SIGHUP or file change in a separate thread."""
+    last_mtime = config_mtime()
+    while True:
+        requested = reload_requested.wait(timeout=config_watch_interval if config_watch_interval > 0 else None)
+        reload_requested.clear()
+
+        mtime = config_mtime()
+        if requested or mtime != last_mtime:
+            last_mtime = mtime
+            try:
+                reload_config()
+            except Exception as e:
+                print(f"Error reloading config.ini: {str(e)}")
+
 def on_connect(client, userdata, flags, reason_code, properties):
     """Callback when MQTT client connects."""
-    set_topic()
+    global reconnect_count, last_time_to_recover, disconnected_at
 
     if debug:
         print("on_connect")
@@ -852,6 +2120,13 @@ def on_connect(client, userdata, flags, reason_code, properties):
             print("client is connected")
 
     if reason_code == 0:
+        mqtt_connected.set()
+        if disconnected_at is not None:
+            reconnect_count += 1
+            last_time_to_recover = time.time() - disconnected_at
+            disconnected_at = None
+            update_console(f"{format_time(current_time())} >>> Reconnected after {last_time_to_recover:.1f}s (reconnect #{reconnect_count})", tag="info")
+
         load_message_history_from_db()
         if debug:
             print(f"Subscribe Topics are: {subscribe_topics}")
@@ -865,6 +2140,7 @@ def on_connect(client, userdata, flags, reason_code, properties):
         topic_list = ", ".join([topic.replace(f"{channel}/#", f"{channel}") for topic in subscribe_topics])
         message = f"{format_time(current_time())} >>> Connected to {mqtt_broker} on topics {topic_list} as {'!' + hex(node_number)[2:]}"
         update_console(message, tag="info")
+        flush_outbox()
         send_node_info(BROADCAST_NUM, want_response=False)
 
     else:
@@ -873,27 +2149,33 @@ def on_connect(client, userdata, flags, reason_code, properties):
 
 def on_disconnect(client, userdata, flags, reason_code, properties):
     """Callback when MQTT client disconnects."""
+    global disconnected_at
     if debug:
         print("on_disconnect")
+    mqtt_connected.clear()
     if reason_code != 0:
         message = f"{format_time(current_time())} >>> Disconnected from MQTT broker with result code {str(reason_code)}"
         update_console(message, tag="info")
+        if disconnected_at is None:
+            disconnected_at = time.time()
         if auto_reconnect is True:
-            print("attempting to reconnect in " + str(auto_reconnect_delay) + " second(s)")
-            time.sleep(auto_reconnect_delay)
-            connect_mqtt()
+            # The supervisor thread handles backoff so the network loop is never blocked
+            reconnect_requested.set()
 
-def load_message_history_from_db():
-    """Load previously stored messages from sqlite - console version."""
+def load_message_history_from_db(region=None):
+    """Load previously stored messages from sqlite, optionally for one region only - console version."""
     if debug:
         print("load_message_history_from_db")
 
-    table_name = sanitize_string(mqtt_broker) + "_" + sanitize_string(root_topic) + sanitize_string(channel) + "_messages"
+    table_name = table_prefix + "_messages"
 
     try:
         with sqlite3.connect(db_file_path) as db_connection:
             db_cursor = db_connection.cursor()
-            messages = db_cursor.execute(f'SELECT time, sender_short_name, text_payload, is_encrypted FROM {table_name} ORDER BY time DESC LIMIT 10').fetchall()
+            if region is None:
+                messages = db_cursor.execute(f'SELECT time, sender_short_name, text_payload, is_encrypted FROM {table_name} ORDER BY time DESC LIMIT 10').fetchall()
+            else:
+                messages = db_cursor.execute(f'SELECT time, sender_short_name, text_payload, is_encrypted FROM {table_name} WHERE region=? ORDER BY time DESC LIMIT 10', (region,)).fetchall()
 
             if debug and messages:
                 print("Recent message history:")
@@ -925,7 +2207,9 @@ def mqtt_thread():
         else:
             print("client not connected")
     while True:
-        client.loop()
+        if client.loop() != mqtt.MQTT_ERR_SUCCESS:
+            # Avoid spinning while the supervisor is waiting to reconnect
+            time.sleep(0.1)
 
 def send_node_info_periodically() -> None:
     """Function to broadcast NodeInfo in a separate thread."""
@@ -943,6 +2227,15 @@ def on_exit():
     
     client.loop_stop()
 
+    flush_routing()
+    flush_usage()
+
+    if record_locations:
+        flush_positions()
+
+    if record_telemetry:
+        flush_telemetry()
+
 def update_console(text_payload, tag=None):
     """Print message to console."""
     if debug:
@@ -950,15 +2243,270 @@ def update_console(text_payload, tag=None):
     else:
         print(text_payload)
 
+def initialize():
+    """Load config.ini and build the state that depends on it. Called at startup, not at import."""
+    global global_message_id, outbox, global_bucket, ack_wheel
+    load_config()
+
+    if not is_valid_hex(node_name, 8, 8):
+        print('Invalid node name from config: ' + str(node_name))
+        sys.exit(1)
+
+    global_message_id = random.getrandbits(32)
+    outbox = deque(maxlen=outbox_size)  # (row_id, topic, payload) waiting for the broker
+    global_bucket = [max(1.0, global_fortunes_per_minute), time.monotonic()]
+    ack_wheel = [set() for _ in range(int(ack_timeout * (2 ** max_retransmits) / ack_wheel_tick) + 2)]
+
+# Memory accounting
+memory_stats = {"rss_mb": None, "shrinks": 0, "shed_packets": 0}
+shedding_broadcasts = False  # Set while over memory_budget_mb; only packets addressed to us are processed
+memory_report_requested = threading.Event()
+tracemalloc_snapshot = None
+
+def current_rss_mb():
+    """Return resident memory in MB, or None where /proc is not available."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+def deep_sizeof(obj, seen=None) -> int:
+    """Approximate bytes held by obj and everything reachable through its containers, __slots__ and __dict__."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in list(obj.items()))
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_sizeof(item, seen) for item in list(obj))
+    elif hasattr(obj, "ByteSize"):
+        # Protobuf messages keep their fields outside the Python object
+        size += obj.ByteSize()
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_sizeof(getattr(obj, name), seen) for name in obj.__slots__ if hasattr(obj, name))
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+def get_memory_usage() -> dict:
+    """Return entries and approximate bytes for each long-lived in-memory structure."""
+    structures = {
+        "node_registry": node_registry.nodes,
+        "regions": node_registry.regions,
+        "sender_buckets": sender_buckets,
+        "pending_fortunes": pending_fortunes,
+        "pending_acks": pending_acks,
+        "ack_wheel": ack_wheel,
+        "nodeinfo_requests": nodeinfo_requests,
+        "nodeinfo_asked": nodeinfo_asked,
+        "outbox": outbox,
+        "pending_positions": pending_positions,
+        "last_history_time": last_history_time,
+        "pending_telemetry": pending_telemetry,
+        "pending_usage": pending_usage,
+        "fortune_corpus": fortune_corpus,
+        "fortune_index": fortune_index,
+        "fortune_line_cache": fortune_line_cache,
+        "recent_messages": recent_messages,
+        "status_snapshot": status_snapshot,
+    }
+    return {name: {"entries": len(value), "bytes": deep_sizeof(value)} for name, value in structures.items()}
+
+def print_memory_report():
+    """Print structure sizes and, with memory_tracemalloc, the allocation growth since the previous report."""
+    global tracemalloc_snapshot
+    rss = current_rss_mb()
+    print(f"Memory report: {'unknown' if rss is None else f'{rss:.1f} MB'} resident, budget {memory_budget_mb or 'off'}")
+    for name, usage in sorted(get_memory_usage().items(), key=lambda item: item[1]["bytes"], reverse=True):
+        print(f"  {usage['bytes'] / 1024:10.1f} KB  {usage['entries']:7d}  {name}")
+
+    if not memory_tracemalloc:
+        return
+
+    # Imported on demand: tracing costs memory and CPU, so it only starts with the first report
+    import tracemalloc
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        tracemalloc_snapshot = tracemalloc.take_snapshot()
+        print("Tracemalloc started; the next report shows growth since now")
+        return
+
+    snapshot = tracemalloc.take_snapshot()
+    print("Top allocation growth since the previous report:")
+    for stat in snapshot.compare_to(tracemalloc_snapshot, "lineno")[:10]:
+        print(f"  {stat}")
+    tracemalloc_snapshot = snapshot
+
+def shrink_caches():
+    """Drop the older half of every cache that can be re-learned from traffic or sqlite."""
+    # Persist routes first so pruned nodes can still be restored after a restart
+    flush_routing()
+    last_seen = sorted(record.last_seen for record in list(node_registry.nodes.values()))
+    removed_nodes = node_registry.prune(last_seen[len(last_seen) // 2]) if last_seen else 0
+
+    with pending_fortunes_cond:
+        for _ in range(len(sender_buckets) // 2):
+            sender_buckets.popitem(last=False)
+    with nodeinfo_cond:
+        for _ in range(len(nodeinfo_asked) // 2):
+            nodeinfo_asked.popitem(last=False)
+    # Losing this only means one extra position history row per node
+    last_history_time.clear()
+
+    gc.collect()
+    memory_stats["shrinks"] += 1
+    if debug:
+        print(f"Shrank caches, forgot {removed_nodes} node(s)")
+
+def memory_monitor():
+    """Function to print memory reports on SIGUSR1 and enforce memory_budget_mb in a separate thread."""
+    global shedding_broadcasts
+    while True:
+        if memory_report_requested.wait(timeout=memory_check_interval):
+            memory_report_requested.clear()
+            print_memory_report()
+
+        rss = current_rss_mb()
+        memory_stats["rss_mb"] = None if rss is None else round(rss, 1)
+        if rss is None or memory_budget_mb <= 0:
+            continue
+
+        if rss > memory_budget_mb * 0.9:
+            # Caches go first; broadcasts are shed only if that was not enough
+            shrink_caches()
+            rss = current_rss_mb()
+            if rss > memory_budget_mb and not shedding_broadcasts:
+                shedding_broadcasts = True
+                update_console(f"{format_time(current_time())} >>> Memory {rss:.0f} MB over budget, ignoring broadcast traffic", tag="info")
+        elif shedding_broadcasts and rss < memory_budget_mb * 0.75:
+            shedding_broadcasts = False
+            update_console(f"{format_time(current_time())} >>> Memory {rss:.0f} MB back under budget, processing broadcasts again", tag="info")
+
+# Status API
+recent_messages = deque(maxlen=50)  # Recent DMs to us, newest last
+status_snapshot = {}  # path -> (etag, json body), replaced wholesale on every refresh
+started_at = time.time()
+
+def build_status_snapshot() -> dict:
+    """Serialize in-memory state into read-only JSON documents for the status API."""
+    with pending_fortunes_cond:
+        pending_fortune_count = len(pending_fortunes)
+    with nodeinfo_cond:
+        nodeinfo_request_count = len(nodeinfo_requests)
+
+    documents = {
+        "/status": {
+            # A fixed start time rather than a running uptime, so the ETag only changes with the state
+            "started_at": int(started_at),
+            "node": node_name,
+            "connection": get_connection_stats(),
+            "queues": {
+                "outbox": len(outbox),
+                "pending_fortunes": pending_fortune_count,
+                "pending_acks": len(pending_acks),
+                "nodeinfo_requests": nodeinfo_request_count,
+                "pending_positions": len(pending_positions),
+                "pending_telemetry": len(pending_telemetry),
+            },
+            "known_nodes": len(node_registry),
+            "rate_limits": dict(rate_limit_stats),
+            "delivery": get_delivery_stats(),
+            "airtime": dict(airtime_stats),
+            "memory": dict(memory_stats, shedding_broadcasts=shedding_broadcasts),
+        },
+        "/nodes": [
+            {"id": record.user_id, "short_name": record.short_name, "long_name": record.long_name,
+             "hw_model": record.hw_model, "last_seen": record.last_seen,
+             "region": node_registry.regions[record.region_index] if record.region_index >= 0 else None}
+            for record in list(node_registry.nodes.values())
+        ],
+        "/messages": list(recent_messages),
+        "/routing": {
+            record.user_id: node_registry.regions[record.region_index]
+            for record in list(node_registry.nodes.values()) if record.region_index >= 0
+        },
+    }
+
+    snapshot = {}
+    for path, document in documents.items():
+        body = json.dumps(document, ensure_ascii=False).encode("utf-8")
+        snapshot[path] = ('"' + hashlib.sha1(body).hexdigest() + '"', body)
+    return snapshot
+
+def refresh_status_periodically() -> None:
+    """Function to rebuild the status API snapshot in a separate thread."""
+    global status_snapshot
+    while True:
+        try:
+            status_snapshot = build_status_snapshot()
+        except Exception as e:
+            print(f"Error building status snapshot: {str(e)}")
+        time.sleep(status_refresh_interval)
+
+def start_status_api():
+    """Start the status API and its snapshot refresher."""
+    # Imported here so the http stack only loads when the API is enabled
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class StatusRequestHandler(BaseHTTPRequestHandler):
+        """Serves the latest snapshot; never touches sqlite or shared locks."""
+
+        def do_GET(self):
+            entry = status_snapshot.get(self.path.split('?')[0].rstrip('/') or "/status")
+            if entry is None:
+                self.send_error(404)
+                return
+
+            etag, body = entry
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            if debug:
+                print("status api: " + format % args)
+
+    server = ThreadingHTTPServer((status_api_host, status_api_port), StatusRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=refresh_status_periodically, daemon=True).start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    update_console(f"{format_time(current_time())} >>> Status API on http://{status_api_host}:{status_api_port}/status", tag="info")
+
 # Global initialization
-node_name = '!' + hex(node_number)[2:]
-if not is_valid_hex(node_name, 8, 8):
-    print('Invalid node name from config: ' + str(node_name))
-    sys.exit(1)
+outbox_lock = threading.Lock()
+mqtt_connected = threading.Event()
+reconnect_requested = threading.Event()
+reconnect_count = 0
+disconnected_at = None
+last_time_to_recover = None
+
+reload_requested = threading.Event()
 
-global_message_id = random.getrandbits(32)
+routing_flushed_at = 0
+
+ack_wheel_tick = 1.0  # seconds per timer wheel slot
+ack_wheel_position = 0
 
 if __name__ == "__main__":
+    initialize()
+
     print("Meshtastic Fortune Bot")
     print("=====================")
     print(f"Node: {node_name} ({client_short_name})")
@@ -980,6 +2528,55 @@ if __name__ == "__main__":
     node_info_timer = threading.Thread(target=send_node_info_periodically, daemon=True)
     node_info_timer.start()
 
+    supervisor_thread = threading.Thread(target=connection_supervisor, daemon=True)
+    supervisor_thread.start()
+
+    fortune_thread = threading.Thread(target=fortune_reply_worker, daemon=True)
+    fortune_thread.start()
+
+    ack_thread = threading.Thread(target=ack_timer, daemon=True)
+    ack_thread.start()
+
+    nodeinfo_thread = threading.Thread(target=node_info_scheduler, daemon=True)
+    nodeinfo_thread.start()
+
+    config_thread = threading.Thread(target=config_watcher, daemon=True)
+    config_thread.start()
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload_requested.set())
+
+    memory_thread = threading.Thread(target=memory_monitor, daemon=True)
+    memory_thread.start()
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: memory_report_requested.set())
+
+    if record_locations:
+        position_thread = threading.Thread(target=flush_positions_periodically, daemon=True)
+        position_thread.start()
+
+    if record_telemetry:
+        telemetry_thread = threading.Thread(target=flush_telemetry_periodically, daemon=True)
+        telemetry_thread.start()
+
+    # Restore packets buffered and routes learned before the last shutdown
+    setup_db()
+    # The small tables move over first so they are restored below; the rest migrate in the background
+    migrate_legacy_tables(("routing", "nodeinfo", "outbox"))
+    load_outbox_from_db()
+    load_routing_from_db()
+
+    maintenance_thread = threading.Thread(target=storage_maintenance, daemon=True)
+    maintenance_thread.start()
+
+    routing_thread = threading.Thread(target=flush_routing_periodically, daemon=True)
+    routing_thread.start()
+
+    usage_thread = threading.Thread(target=flush_usage_periodically, daemon=True)
+    usage_thread.start()
+
+    if status_api_enabled:
+        start_status_api()
+
     # Auto-connect to MQTT
     connect_mqtt()
 
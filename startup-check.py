@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Startup import budget check for the fortune bot.
+
+Loads mqtt-connect.py under `python -X importtime` without starting the bot,
+then fails if imports take longer than the budget or pull in modules the bot
+should only load on demand.
+
+Usage: python startup-check.py [budget_ms]
+"""
+
+import subprocess
+import sys
+
+default_budget_ms = 400
+
+# Modules the bot itself should only load on first use (or never).
+# ssl is not listed: paho-mqtt imports it unconditionally.
+deferred_modules = [
+    "cryptography",   # loaded by the first encrypted packet
+    "serial",         # meshtastic serial interface
+    "bleak",          # meshtastic BLE interface
+    "pubsub",         # meshtastic interface events
+    "meshtastic.mesh_interface",
+]
+
+def measure_imports():
+    """Return ({module: cumulative_us}, total_us) for a bot import run."""
+    code = "import runpy; runpy.run_path('mqtt-connect.py', run_name='startup_check')"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr)
+        sys.exit(result.returncode)
+
+    modules = {}
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        cumulative_us = int(cumulative)
+        modules[name.strip()] = cumulative_us
+        # Only top-level entries are counted; nested ones are already in their parent's cumulative time
+        if not name.startswith("  "):
+            total_us += cumulative_us
+
+    return modules, total_us
+
+if __name__ == "__main__":
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else default_budget_ms
+    modules, total_us = measure_imports()
+
+    print(f"Total import time: {total_us / 1000:.1f} ms (budget {budget_ms:.0f} ms)")
+    print("Slowest imports:")
+    for name, cumulative_us in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:10]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    loaded = [name for name in deferred_modules if name in modules]
+    if loaded:
+        print(f"FAIL: modules that should be deferred were imported: {', '.join(loaded)}")
+        failed = True
+    if total_us / 1000 > budget_ms:
+        print("FAIL: import time over budget")
+        failed = True
+
+    sys.exit(1 if failed else 0)
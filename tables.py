@@ -0,0 +1,26 @@
+import configparser
+import re
+
+def sanitize_string(input_str: str) -> str:
+    """Sanitize string for database table names."""
+    if not re.match(r'^[a-zA-Z_]', input_str):
+        input_str = '_' + input_str
+    sanitized_str: str = re.sub(r'[^a-zA-Z0-9_]', '_', input_str)
+    return sanitized_str
+
+def build_table_prefix(mqtt_broker: str, channel: str) -> str:
+    """Return the prefix of every table the bot keeps for a broker and channel."""
+    # Tables are shared by every root topic; rows carry their region instead
+    return sanitize_string(mqtt_broker.split(':')[0]) + "_" + sanitize_string(channel)
+
+def build_legacy_table_prefix(mqtt_broker: str, root_topic: str, channel: str) -> str:
+    """Return the prefix older versions used, named after a single root topic."""
+    return sanitize_string(mqtt_broker.split(':')[0]) + "_" + sanitize_string(root_topic) + sanitize_string(channel)
+
+def read_table_prefix(config_path: str = 'config.ini') -> str:
+    """Build the bot's table prefix from the broker and channel in config.ini."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    mqtt_broker = config.get('DEFAULT', 'mqtt_broker', fallback='mqtt.meshtastic.org')
+    channel = config.get('DEFAULT', 'channel', fallback='LongFast')
+    return build_table_prefix(mqtt_broker, channel)